@@ -0,0 +1,380 @@
+"""
+Lockstep engine: plays many games at once as stacked arrays.
+
+Each game g owns np.random.RandomState(seeds[g]) and consumes it in the
+same order as Game.play would with Board(..., rng=rng) and Deck(..., rng=rng)
+built from that RandomState, so both engines agree game-for-game.
+
+Players are evaluated from their strategy vectors (player.PARAMS), one
+per game and seat, so every game of a batch can play a different strategy.
+"""
+import numpy as np
+from player import PARAMS, HUT_FIRST, WAIT_FOR_BOTH, SUBSTITUTE, BONUS, KEEP
+from model import Game, Deck, Board, get_adjacency, cannot_clear, MONEY_SCALE
+
+HUT, STATION = 1, 2 # purchase codes; 0 = nothing bought yet
+GARDEN, CURSE = 0, 1 # card codes
+CARD_CODES = {"garden": GARDEN, "curse": CURSE}
+
+WIN, TIE, LOSS, MAX_ITERS = range(4)
+STATUS_NAMES = ["WIN", "TIE", "LOSS", "MAX_ITERS"]
+
+class BatchGame:
+    def __init__(self, board, deck, max_nturns=200, vps_to_win=11, stop_stuck=True):
+        """
+        board, deck: prototypes supplying the shape, costs and card counts
+        stop_stuck: end stuck games as MAX_ITERS early, as Game does
+        """
+        self.nrows = board.nrows
+        self.ncols = board.ncols
+        self.ntrees = board.ntrees_init
+        self.cost_of_hut = board.obj_cost["hut"]
+        self.cost_of_station = board.obj_cost["station"]
+        self.min_cost = min(board.obj_cost.values())
+        self.hut_val = board.obj_add["hut"]
+        self.card_info = deck.card_info
+        self.max_nturns = max_nturns
+        self.vps_to_win = vps_to_win
+        self.stop_stuck = stop_stuck
+        adj = get_adjacency(self.nrows, self.ncols)
+        self.slot_tiles = adj.slot_tiles
+        self.tile_slots = adj.tile_slots_padded
+        self.nslots = adj.nslots
+
+    def play(self, players, seeds, batch_size=10000, stats=None, rows=None, params=None):
+        """
+        returns [(status, winner), ...] in the same format as Game.play
+        stats: optional stats.GameStats fed with every game
+        rows: optional list extended with every game's
+            (status code, winner seat or -1, nturns, vps, money, huts, stations)
+        params: optional (games, seats, len(PARAMS)) strategy of every seat
+            in every game, instead of the players' own
+        """
+        out = []
+        for k in xrange(0, len(seeds), batch_size):
+            self.play_batch(players, seeds[k:k+batch_size], params[k:k+batch_size] if params is not None else None)
+            for st, w in zip(self.status, self.winner):
+                out.append((STATUS_NAMES[st], players[w].name if w >= 0 else None))
+            if stats is not None:
+                for g in xrange(len(self.status)):
+                    stats.update(self.nturns[g], self.vps[g], self.money[g]/float(MONEY_SCALE), self.status[g] == MAX_ITERS)
+            if rows is not None:
+                rows.extend(zip(self.status, self.winner, self.nturns, self.vps, self.money, self.huts, self.stations))
+        return out
+
+    def init_state(self, players, seeds, ncards, params=None):
+        # ncards: cards in the deck at the start
+        n = len(seeds)
+        nps = len(players)
+        self.rngs = [np.random.RandomState(s) for s in seeds]
+        self.pidx = np.array([p.index for p in players])
+        if params is None:
+            params = [p.params for p in players]
+        self.params = np.empty([n, nps, len(PARAMS)])
+        self.params[:] = params
+        self.tiles = np.zeros([n, self.nrows*self.ncols], dtype=np.int16)
+        self.grid = np.zeros([n, self.nslots], dtype=np.int8)
+        self.money = np.zeros([n, nps], dtype=np.int32) # in 1/MONEY_SCALE units, as in Players
+        self.vps = np.zeros([n, nps], dtype=int)
+        self.huts = np.zeros([n, nps], dtype=int)
+        self.stations = np.zeros([n, nps], dtype=int)
+        self.last = np.zeros([n, nps], dtype=np.int8)
+        self.status = -np.ones(n, dtype=int)
+        self.winner = -np.ones(n, dtype=int)
+        self.nturns = np.zeros(n, dtype=int)
+
+        cap = ncards + self.max_nturns # at most one extra curse per turn
+        self.pile = np.zeros([n, cap], dtype=np.int8)
+        self.disc = np.zeros([n, cap], dtype=np.int8)
+        self.npile = np.zeros(n, dtype=int)
+        self.ndisc = np.zeros(n, dtype=int)
+
+    def deal(self):
+        cards = []
+        for (name, count) in self.card_info.iteritems():
+            cards.extend([CARD_CODES[name]]*count)
+        for g, rng in enumerate(self.rngs):
+            # same call order as Board.__init__ followed by Deck.__init__
+            row = rng.randint(low=0, high=self.nrows, size=(self.ntrees,))
+            col = rng.randint(low=0, high=self.ncols, size=(self.ntrees,))
+            np.add.at(self.tiles[g], row*self.ncols + col, 1)
+            self.pile[g, :len(cards)] = cards
+            rng.shuffle(self.pile[g, :len(cards)])
+            self.npile[g] = len(cards)
+
+    def play_batch(self, players, seeds, params=None):
+        self.init_state(players, seeds, sum(self.card_info.values()), params)
+        self.deal()
+        self.run(players, 0)
+
+    def play_from(self, players, seeds, start, curse_inds, curse_n):
+        """
+        plays games from mid-game positions instead of fresh deals; each
+        game's draw pile is shuffled from its card counts with its own seed
+        start: per-game arrays "tiles", "grid" (flat), "money", "vps",
+            "huts", "stations", "last" (per seat), "draw", "discard" (counts
+            per card code), and "turn", the turn being played
+        curse_inds, curse_n: per game, the flat tile and amount of a draw by
+            the player to move at start["turn"], or -1 for games whose
+            position already includes that turn
+        """
+        counts = start["draw"] + start["discard"]
+        self.init_state(players, seeds, counts.sum(axis=1).max())
+        for name in ["tiles", "grid", "money", "vps", "huts", "stations", "last"]:
+            getattr(self, name)[:] = start[name]
+        for g, rng in enumerate(self.rngs):
+            for pile, npile, k in [(self.pile, self.npile, "draw"), (self.disc, self.ndisc, "discard")]:
+                cards = np.repeat(np.arange(len(CARD_CODES)), start[k][g])
+                pile[g, :len(cards)] = cards
+                npile[g] = len(cards)
+            rng.shuffle(self.pile[g, :self.npile[g]])
+
+        turn = start["turn"]
+        gs = np.flatnonzero(curse_inds >= 0)
+        cards = self.draw_cards(gs)
+        is_garden = cards == GARDEN
+        self.add_random_gardens(gs[is_garden])
+        s = turn % len(players)
+        self.curse_tiles(gs[~is_garden], s, curse_inds[gs[~is_garden]], curse_n[gs[~is_garden]])
+        self.run(players, turn+1)
+
+    def run(self, players, start):
+        nps = len(players)
+        for i in xrange(start, self.max_nturns):
+            gs = np.flatnonzero(self.status < 0)
+            if len(gs) == 0:
+                break
+            over = self.tiles[gs].sum(axis=1) == 0
+            self.end_games(gs[over], i, False)
+            gs = gs[~over]
+            if self.stop_stuck:
+                stuck = self.is_stuck(gs, i)
+                self.end_games(gs[stuck], i, True)
+                gs = gs[~stuck]
+            s = i % nps
+            bought = self.buy(gs, s)
+            self.draw(np.setdiff1d(gs, bought, assume_unique=True), s)
+        self.end_games(np.flatnonzero(self.status < 0), self.max_nturns, True)
+
+    def is_stuck(self, gs, i):
+        # as Game.is_stuck, per game
+        nturns_left = self.max_nturns - 1 - i
+        ntiles = (self.tiles[gs] > 0).sum(axis=1)
+        ngardens = self.card_info.get("garden", 0)
+        stuck = ntiles + ngardens*(ntiles+1) > nturns_left
+        stuck[stuck] = self.grid[gs[stuck]].max(axis=1) < 0
+        for k in np.flatnonzero(stuck):
+            g = gs[k]
+            piles = []
+            for cards, ncards in [(self.pile, self.npile), (self.disc, self.ndisc)]:
+                curses = int((cards[g, :ncards[g]] == CURSE).sum())
+                piles.append((ncards[g] - curses, curses))
+            stuck[k] = cannot_clear(ntiles[k], piles[0], piles[1], nturns_left)
+        return stuck
+
+    def end_games(self, gs, i, max_iters_reached):
+        if len(gs) == 0:
+            return
+        vps = self.vps[gs]
+        vmax = vps.max(axis=1)
+        is_tie = (vps == vmax[:,None]).sum(axis=1) > 1
+        is_win = vps.sum(axis=1) >= self.vps_to_win
+        status = np.where(is_win, np.where(is_tie, TIE, WIN), LOSS)
+        if max_iters_reached:
+            status[:] = MAX_ITERS
+        self.status[gs] = status
+        self.winner[gs] = np.where(is_win & ~is_tie, vps.argmax(axis=1), -1)
+        self.nturns[gs] = i
+
+    def slot_values(self, gs):
+        return self.tiles[gs][:, self.slot_tiles].sum(axis=2)
+
+    def get_money(self, gs, s):
+        # the same floats Players.get_money hands to the players
+        return self.money[gs, s]/float(MONEY_SCALE)
+
+    def padded_grid(self, gs):
+        grid = np.zeros([len(gs), self.nslots+1], dtype=self.grid.dtype)
+        grid[:, :-1] = self.grid[gs]
+        return grid
+
+    def choose_slots(self, vals, empty):
+        """
+        vectorized DefaultPlayer.get_most_valuable_empty_inds:
+        first most valuable empty slot, else the last empty slot, else -1
+        """
+        masked = np.where(empty, vals, -1)
+        best = masked.argmax(axis=1)
+        vmax = masked[np.arange(len(best)), best]
+        last = empty.shape[1] - 1 - empty[:, ::-1].argmax(axis=1)
+        return np.where(vmax > 0, best, np.where(empty.any(axis=1), last, -1))
+
+    def chance(self, gs, p):
+        """
+        vectorized DefaultPlayer.chance: True where p >= 1, and a draw from
+        the game's rng only where 0 < p < 1
+        """
+        out = p >= 1
+        for k in np.flatnonzero((p > 0) & (p < 1)):
+            out[k] = self.rngs[gs[k]].rand() < p[k]
+        return out
+
+    def buy_object(self, gs, s, money, last):
+        """
+        vectorized DefaultPlayer.buy_object; returns (names, can_place)
+        """
+        params = self.params[gs, s]
+        can_hut = money >= self.cost_of_hut
+        can_station = money >= self.cost_of_station
+        is_hut = self.chance(gs, params[np.arange(len(gs)), HUT_FIRST + last])
+        names = np.where(is_hut, HUT, STATION)
+        both = can_hut & can_station
+        can_name = np.where(is_hut, can_hut, can_station)
+        ok = both.copy()
+        k = np.flatnonzero(~both & can_name)
+        ok[k] = ~self.chance(gs[k], params[k, WAIT_FOR_BOTH])
+        k = np.flatnonzero(~both & ~can_name)
+        swap = self.chance(gs[k], params[k, SUBSTITUTE])
+        names[k] = np.where(swap, np.where(is_hut[k], STATION, HUT), names[k])
+        ok[k] = swap
+        return names, ok
+
+    def buy(self, gs, s):
+        """
+        vectorized DefaultPlayer.buy_objects for player s; returns games that bought
+        """
+        gs = gs[self.get_money(gs, s) >= self.min_cost]
+        if len(gs) == 0:
+            return gs
+        vals = self.slot_values(gs)
+        empty = self.grid[gs] == 0
+        money = self.get_money(gs, s)
+        last = self.last[gs, s].copy()
+        cost = np.zeros(len(gs))
+        nbought = np.zeros(len(gs), dtype=int)
+        acts = [] # (game rows, slots, names) per round of purchases
+        active = np.arange(len(gs))
+        while len(active) > 0:
+            names, ok = self.buy_object(gs[active], s, money[active], last[active])
+            active, names = active[ok], names[ok]
+            pos = self.choose_slots(vals[active], empty[active])
+            ok = pos >= 0
+            active, names, pos = active[ok], names[ok], pos[ok]
+            empty[active, pos] = False
+            c = np.where(names == HUT, self.cost_of_hut, self.cost_of_station)
+            money[active] -= c
+            cost[active] += c
+            last[active] = names
+            nbought[active] += 1
+            acts.append((active, pos, names))
+            active = active[money[active] >= self.min_cost]
+
+        for rows, pos, names in acts:
+            is_hut = names == HUT
+            self.grid[gs[rows], pos] = np.where(is_hut, self.hut_val, self.pidx[s])
+            self.huts[gs[rows], s] += is_hut
+            self.stations[gs[rows], s] += ~is_hut
+        got = nbought > 0
+        self.money[gs[got], s] -= np.round(cost[got]*MONEY_SCALE).astype(int)
+        self.last[gs, s] = last
+        return gs[got]
+
+    def choose_curse_tiles(self, gs, s):
+        """
+        vectorized DefaultPlayer.choose_curse_tile; returns (flat tile inds, amounts)
+        """
+        tiles = self.tiles[gs]
+        grid = self.padded_grid(gs)
+        owned = (grid[:, self.tile_slots] == self.pidx[s]).sum(axis=2)
+        score = owned*tiles
+        inds = score.argmax(axis=1)
+        for k in np.flatnonzero(score.max(axis=1) == 0):
+            opts = np.flatnonzero(tiles[k] > 1)
+            if len(opts) == 0:
+                opts = np.flatnonzero(tiles[k] > 0)
+            inds[k] = opts[self.rngs[gs[k]].randint(len(opts))]
+        v = tiles[np.arange(len(gs)), inds]
+        # vectorized DefaultPlayer.choose_curse_amount
+        params = self.params[gs, s]
+        bonus = v == 2
+        bonus[bonus] = self.chance(gs[bonus], params[bonus, BONUS])
+        keep = np.floor(params[:, KEEP]).astype(int)
+        k = np.flatnonzero(~bonus)
+        keep[k] += self.chance(gs[k], params[k, KEEP] - keep[k])
+        return inds, np.where(bonus, 2, np.maximum(1, v - keep))
+
+    def draw_cards(self, gs):
+        for g in gs[self.npile[gs] == 0]:
+            k = self.ndisc[g]
+            self.pile[g, :k] = self.disc[g, :k]
+            self.rngs[g].shuffle(self.pile[g, :k])
+            self.npile[g] = k
+            self.ndisc[g] = 0
+        self.npile[gs] -= 1
+        cards = self.pile[gs, self.npile[gs]]
+        self.disc[gs, self.ndisc[gs]] = cards
+        self.ndisc[gs] += 1
+        return cards
+
+    def draw(self, gs, s):
+        if len(gs) == 0:
+            return
+        inds, n = self.choose_curse_tiles(gs, s)
+        cards = self.draw_cards(gs)
+
+        is_garden = cards == GARDEN
+        self.add_random_gardens(gs[is_garden])
+        is_curse = ~is_garden
+        self.curse_tiles(gs[is_curse], s, inds[is_curse], n[is_curse])
+
+    def add_random_gardens(self, gs, hut_multiplier=2):
+        if len(gs) == 0:
+            return
+        inds = np.zeros(len(gs), dtype=int)
+        for k, g in enumerate(gs):
+            # same calls as Board.get_tree_ind(tiles, n=1)
+            r = self.rngs[g].randint(low=0, high=self.nrows, size=(1,))[0]
+            c = self.rngs[g].randint(low=0, high=self.ncols, size=(1,))[0]
+            inds[k] = r*self.ncols + c
+        grid = self.padded_grid(gs)
+        v = (grid[np.arange(len(gs))[:,None], self.tile_slots[inds]] == self.hut_val).sum(axis=1)
+        self.tiles[gs, inds] += hut_multiplier*v + 1
+
+    def curse_tiles(self, gs, s, inds, n):
+        if len(gs) == 0:
+            return
+        self.tiles[gs, inds] -= n
+        grid = self.padded_grid(gs)
+        touching = grid[np.arange(len(gs))[:,None], self.tile_slots[inds]]
+        for q, pind in enumerate(self.pidx):
+            self.vps[gs, q] += (touching == pind).sum(axis=1)
+        cursed = gs[self.tiles[gs, inds] == 0]
+        self.disc[cursed, self.ndisc[cursed]] = CURSE
+        self.ndisc[cursed] += 1
+        self.money[gs, s] += ((n > 1) + n)*MONEY_SCALE
+
+def play_reference(board, deck, players, seed, max_nturns=200, vps_to_win=11):
+    """
+    plays one game with Game.play, seeded the same way as BatchGame
+    """
+    rng = np.random.RandomState(seed)
+    b = Board((board.nrows, board.ncols), board.obj_cost, board.ntrees_init, rng=rng)
+    d = Deck(deck.card_info, rng=rng)
+    g = Game(b, d, max_nturns=max_nturns, vps_to_win=vps_to_win)
+    return g.play([p.__class__(p.index, p.name, p.params) for p in players], print_end_status=False)
+
+if __name__ == '__main__':
+    import time
+    from game import get_players
+    board = Board((6,6), {"hut": 0.05, "station": 3}, ntrees=9)
+    deck = Deck({"garden": 3, "curse": 3})
+    ps = get_players(["selfish", "reasonable"])
+    seeds = range(2000)
+
+    t = time.time()
+    res = BatchGame(board, deck).play(ps, seeds)
+    print "batch: {0:.2f}s".format(time.time() - t)
+    t = time.time()
+    ref = [play_reference(board, deck, ps, s) for s in seeds]
+    print "serial: {0:.2f}s".format(time.time() - t)
+    print "{0}/{1} games match".format(sum([a == b for a,b in zip(res, ref)]), len(seeds))
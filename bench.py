@@ -0,0 +1,217 @@
+"""
+Benchmarks: games/sec for every ordered pairing of the player types per
+board size, and microbenchmarks of the Board/player queries on a
+mid-game board. With --scaling, the cost per turn as the number of
+players and the board grow instead. Results are saved as JSON; with
+--compare, every result that got slower than the baseline by more than
+--threshold is flagged.
+
+    python bench.py --quick --json base.json
+    python bench.py --quick --compare base.json
+    python bench.py --scaling
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import timeit
+import numpy as np
+from batch import BatchGame
+from game import PLAYER_TYPES, make_game, get_players
+from model import Players
+
+SHAPES = [(6,6), (12,12), (25,25), (50,50), (100,100), (200,200)]
+QUICK_SHAPES = [(6,6), (25,25), (100,100)]
+SCALING_SHAPES = [(6,6), (50,50), (200,200), (500,500)]
+SCALING_PLAYERS = [2, 8, 16, 32, 64]
+TREE_DENSITY = 9/36.0 # GAME_CONFIG's trees per tile
+
+def bench_config(shape):
+    return {"shape": shape, "ntrees": max(1, int(round(TREE_DENSITY*shape[0]*shape[1])))}
+
+def shape_name(shape):
+    return "{0}x{1}".format(*shape)
+
+def games_per_sec(ptypes, shape, min_time=0.5, use_batch=False, seed=0):
+    """
+    plays seeded games until min_time has passed; for the batch engine,
+    doubles the batch size until one batch takes min_time
+    """
+    config = bench_config(shape)
+    if use_batch:
+        g = make_game(config=config)
+        bg = BatchGame(g.board, g.deck, g.max_nturns, g.vps_to_win)
+        n = 16
+        while True:
+            t = time.time()
+            bg.play(get_players(ptypes), [[seed, i] for i in xrange(n)])
+            dt = time.time() - t
+            if dt >= min_time:
+                return n/dt, n
+            n *= 2
+    n = 0
+    t = time.time()
+    while n == 0 or time.time() - t < min_time:
+        g = make_game(rng=np.random.RandomState([seed, n]), config=config)
+        g.play(get_players(ptypes), print_end_status=False)
+        n += 1
+    return n/(time.time() - t), n
+
+def midgame_board(shape, nturns=None, seed=0):
+    """
+    a board after nturns (default: one per 4 tiles, at most 100) of
+    reasonable vs cautious, so queries see trees, objects and a used heap
+    """
+    nturns = nturns if nturns is not None else min(100, shape[0]*shape[1]/4)
+    g = make_game(rng=np.random.RandomState(seed), config=bench_config(shape))
+    ps = get_players(["reasonable", "cautious"])
+    Ps = Players(ps)
+    for i in xrange(nturns):
+        if g.game_is_over():
+            break
+        g.next_turn(ps[i % 2], Ps)
+    return g.board, ps[0]
+
+def turn_cost(nplayers, shape, nturns=200, min_time=0.5, seed=0):
+    """
+    us per turn of Game.play with nplayers seats cycling through the
+    player types, over games of at most nturns; board setup is not timed
+    returns (us per turn, turns played)
+    """
+    ptypes = sorted(PLAYER_TYPES)
+    config = dict(bench_config(shape), max_nturns=nturns, vps_to_win=10**6)
+    dt = 0.0
+    n = 0
+    i = 0
+    while n == 0 or dt < min_time:
+        g = make_game(rng=np.random.RandomState([seed, i]), config=config)
+        ps = get_players([ptypes[k % len(ptypes)] for k in xrange(nplayers)])
+        t = time.time()
+        g.play(ps, print_end_status=False)
+        dt += time.time() - t
+        n += g.nturns
+        i += 1
+    return 1e6*dt/n, n
+
+def time_call(f, min_time=0.2, repeat=5):
+    """
+    best time per call in us, calibrating the loop count so one of the
+    repeat runs takes about min_time/repeat
+    """
+    timer = timeit.Timer(f)
+    number = 1
+    while timer.timeit(number) < min_time/repeat:
+        number *= 2
+    return 1e6*min(timer.repeat(repeat, number))/number
+
+def micro_benchmarks(shape, min_time=0.2):
+    board, p = midgame_board(shape)
+    r, c = shape[0]/2, shape[1]/2
+    return [
+        ("valid_object_inds", time_call(board.valid_object_inds, min_time)),
+        ("valid_curse_inds", time_call(board.valid_curse_inds, min_time)),
+        ("grids_touching_tile", time_call(lambda: board.grids_touching_tile(r, c), min_time)),
+        ("get_most_valuable_empty_inds", time_call(lambda: p.get_most_valuable_empty_inds(board, []), min_time)),
+    ]
+
+def scaling(shapes=SCALING_SHAPES, nplayers=SCALING_PLAYERS, min_time=0.5):
+    """
+    returns results as run does, for turn_cost over shapes x nplayers
+    """
+    results = {}
+    for shape in shapes:
+        for n in nplayers:
+            us, nturns = turn_cost(n, shape, min_time=min_time)
+            key = "turn/{0}/{1}p".format(shape_name(shape), n)
+            results[key] = {"value": us, "unit": "us", "higher_is_better": False, "nturns": nturns}
+            print "{0:<55}{1:>12.2f} us".format(key, us)
+            sys.stdout.flush()
+    return results
+
+def run(shapes=SHAPES, ptypes=None, min_time=0.5, micro_time=0.2, use_batch=False, games=True, micro=True):
+    """
+    returns {name: {"value", "unit", "higher_is_better"[, "ngames"]}}
+    """
+    ptypes = ptypes if ptypes is not None else sorted(PLAYER_TYPES)
+    results = {}
+    for shape in shapes:
+        if micro:
+            for name, us in micro_benchmarks(shape, micro_time):
+                key = "micro/{0}/{1}".format(shape_name(shape), name)
+                results[key] = {"value": us, "unit": "us", "higher_is_better": False}
+                print "{0:<55}{1:>12.2f} us".format(key, us)
+        if games:
+            for p1 in ptypes:
+                for p2 in ptypes:
+                    rate, n = games_per_sec([p1, p2], shape, min_time, use_batch)
+                    key = "games/{0}/{1}/{2}-{3}".format("batch" if use_batch else "serial", shape_name(shape), p1, p2)
+                    results[key] = {"value": rate, "unit": "games/s", "higher_is_better": True, "ngames": n}
+                    print "{0:<55}{1:>12.1f} games/s".format(key, rate)
+        sys.stdout.flush()
+    return results
+
+def save(results, fn):
+    meta = {"python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(), "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+    with open(fn, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=1, sort_keys=True)
+
+def compare(results, baseline, threshold=0.1):
+    """
+    returns [(name, baseline value, value, slowdown), ...] for the results
+    slower than the baseline by more than threshold (0.1 = 10%)
+    """
+    slower = []
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+        old, new = baseline[name]["value"], results[name]["value"]
+        if results[name]["higher_is_better"]:
+            slowdown = old/max(new, 1e-12) - 1
+        else:
+            slowdown = new/max(old, 1e-12) - 1
+        if slowdown > threshold:
+            slower.append((name, old, new, slowdown))
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="boards {0} only".format(', '.join(map(shape_name, QUICK_SHAPES))))
+    parser.add_argument("--shapes", help="comma-separated sizes, e.g. 6,50 for 6x6 and 50x50")
+    parser.add_argument("--players", help="comma-separated player types (default: all); with --scaling, player counts")
+    parser.add_argument("--batch", action="store_true", help="time the lockstep engine instead of Game.play")
+    parser.add_argument("--no-games", action="store_true")
+    parser.add_argument("--no-micro", action="store_true")
+    parser.add_argument("--scaling", action="store_true", help="us per turn for {0} players on boards {1}".format(','.join(map(str, SCALING_PLAYERS)), ', '.join(map(shape_name, SCALING_SHAPES))))
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds per pairing")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="slowdown to flag (default 0.1 = 10%%)")
+    args = parser.parse_args(argv)
+
+    shapes = QUICK_SHAPES if args.quick else SHAPES
+    if args.scaling:
+        shapes = SCALING_SHAPES
+    if args.shapes:
+        shapes = [(int(s), int(s)) for s in args.shapes.split(",")]
+    if args.scaling:
+        nplayers = map(int, args.players.split(",")) if args.players else SCALING_PLAYERS
+        results = scaling(shapes, nplayers, args.min_time)
+    else:
+        ptypes = args.players.split(",") if args.players else None
+        results = run(shapes, ptypes, args.min_time, use_batch=args.batch, games=not args.no_games, micro=not args.no_micro)
+    if args.json:
+        save(results, args.json)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        slower = compare(results, baseline, args.threshold)
+        print "=================="
+        for name, old, new, slowdown in slower:
+            print "SLOWER {0}: {1:.2f} -> {2:.2f} {3} ({4:+.0%})".format(name, old, new, results[name]["unit"], slowdown)
+        print "{0} of {1} results slower than the baseline by more than {2:.0%}".format(len(slower), len([n for n in results if n in baseline]), args.threshold)
+        return 1 if slower else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+"""
+Checks that CountingDeck draws like Deck.
+
+Both decks play the same number of draws per game, adding a curse to the
+discard after a curse draw with prob. p_add_curse (as Game does when a
+tile runs out). For every card name and draw position, the share of
+games drawing that card there must agree within max_z standard errors.
+
+    python check_decks.py      # exits 1 on a mismatch
+"""
+import sys
+import numpy as np
+from model import Deck, CountingDeck
+
+def draw_counts(deck, ngames, ndraws, p_add_curse, rng):
+    """
+    {card name: (ndraws,) number of games drawing it at each position}
+    """
+    counts = dict((name, np.zeros(ndraws)) for name in deck.card_info)
+    for i in xrange(ngames):
+        deck.init_deck()
+        for j in xrange(ndraws):
+            card = deck.draw()
+            counts[card][j] += 1
+            if card == "curse" and rng.rand() < p_add_curse:
+                deck.add_card("curse")
+    return counts
+
+def compare_decks(ngames=20000, ndraws=40, p_add_curse=0.3, card_info=None, seed=0, max_z=4.0):
+    """
+    returns (passed, largest |z| over card names and draw positions)
+    """
+    card_info = card_info if card_info is not None else {"garden": 3, "curse": 3}
+    rng = np.random.RandomState(seed)
+    a, b = [draw_counts(deck, ngames, ndraws, p_add_curse, rng) for deck in [Deck(card_info, rng=rng), CountingDeck(card_info, rng=rng)]]
+    zmax = 0.0
+    for name in sorted(card_info):
+        pa, pb = a[name]/ngames, b[name]/ngames
+        p = (pa + pb)/2
+        z = (pa - pb)/np.sqrt(np.maximum(p*(1-p), 1e-12)*2.0/ngames)
+        zmax = max(zmax, np.abs(z).max())
+        print "P({0}) by draw: Deck {1}".format(name, np.round(pa, 3))
+        print "P({0}) by draw: CountingDeck {1}".format(name, np.round(pb, 3))
+    print "max |z| = {0:.2f} ({1})".format(zmax, "ok" if zmax < max_z else "FAILED")
+    return zmax < max_z, zmax
+
+if __name__ == '__main__':
+    passed, zmax = compare_decks()
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,277 @@
+"""
+File-based work queue for spreading runs over several machines.
+
+A run (config, seating, seed, ngames) is split into units of games
+[start, stop); a unit's id is the sha1 of its description, so submitting
+the same unit twice is a no-op. The queue is a directory on a filesystem
+every node can see:
+
+    todo/<id>.json      waiting units
+    claimed/<id>.json   units being played; a worker claims a unit by
+                        renaming it here and touches it while it plays
+    done/<id>.npy       results (store.row_dtype rows)
+
+Renames are atomic, so two workers never claim the same unit. A claim
+whose file is not touched for lease seconds belongs to a dead worker and
+goes back to todo, up to max_attempts times. A unit whose result is in
+done/ is never played again, even if a slow worker and its replacement
+both get to the end.
+
+    python dispatch.py work QUEUE_DIR       # on every node
+    python dispatch.py run QUEUE_DIR        # submit, reap and merge, with local workers
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import numpy as np
+from runner import play_results, shards
+from store import config_desc, to_rows, print_summary
+
+def unit_id(unit):
+    desc = dict((k, unit[k]) for k in ["config", "players", "seed", "start", "stop"])
+    return hashlib.sha1(json.dumps(desc, sort_keys=True)).hexdigest()
+
+def make_units(runs, unit_size=2000):
+    """
+    runs: [(config, player_types, seed, ngames), ...]
+    """
+    units = []
+    for config, player_types, seed, ngames in runs:
+        for a, b in shards(ngames, max(1, ngames/unit_size)):
+            units.append({"config": config_desc(config), "players": list(player_types), "seed": seed, "start": a, "stop": b})
+    return units
+
+def tmp_name(fn):
+    # per process, so two workers finishing the same unit never share a temp file
+    return "{0}.{1}-{2}.tmp".format(fn, socket.gethostname(), os.getpid())
+
+def write_json(fn, obj):
+    tmp = tmp_name(fn)
+    with open(tmp, "w") as f:
+        json.dump(obj, f, sort_keys=True)
+    os.rename(tmp, fn)
+
+class WorkQueue:
+    def __init__(self, root, lease=60, max_attempts=3):
+        self.root = root
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.dirs = dict((d, os.path.join(root, d)) for d in ["todo", "claimed", "done", "failed"])
+        for d in self.dirs.values():
+            if not os.path.exists(d):
+                os.makedirs(d)
+
+    def path(self, d, uid):
+        return os.path.join(self.dirs[d], uid + (".npy" if d == "done" else ".json"))
+
+    def ids(self, d):
+        ext = ".npy" if d == "done" else ".json"
+        return [fn[:-len(ext)] for fn in os.listdir(self.dirs[d]) if fn.endswith(ext)]
+
+    def submit(self, units):
+        """
+        queues the units not already queued, claimed or done; returns their ids
+        """
+        ids = []
+        for unit in units:
+            uid = unit_id(unit)
+            ids.append(uid)
+            if any([os.path.exists(self.path(d, uid)) for d in self.dirs]):
+                continue
+            unit = dict(unit, attempts=0)
+            write_json(self.path("todo", uid), unit)
+        return ids
+
+    def claim(self, worker):
+        """
+        returns (id, unit) of a unit now owned by worker, or None if todo is empty
+        """
+        for uid in self.ids("todo"):
+            try:
+                os.rename(self.path("todo", uid), self.path("claimed", uid))
+            except OSError:
+                continue # another worker got it
+            try:
+                # the rename keeps the submit time; without this reap could take the claim for stale
+                os.utime(self.path("claimed", uid), None)
+                if os.path.exists(self.path("done", uid)):
+                    # a requeued unit that its first worker finished after all
+                    self.release(uid)
+                    continue
+                with open(self.path("claimed", uid)) as f:
+                    unit = json.load(f)
+            except (OSError, IOError, ValueError):
+                continue
+            unit["worker"] = worker
+            write_json(self.path("claimed", uid), unit)
+            return uid, unit
+        return None
+
+    def touch(self, uid):
+        try:
+            os.utime(self.path("claimed", uid), None)
+        except OSError:
+            pass # reaped
+
+    def complete(self, uid, rows):
+        fn = self.path("done", uid)
+        if not os.path.exists(fn):
+            tmp = tmp_name(fn)
+            with open(tmp, "wb") as f:
+                np.save(f, rows)
+            try:
+                os.rename(tmp, fn)
+            except OSError:
+                # another worker's copy of the same rows got there first
+                if not os.path.exists(fn):
+                    raise
+                os.remove(tmp)
+        self.release(uid)
+
+    def release(self, uid):
+        try:
+            os.remove(self.path("claimed", uid))
+        except OSError:
+            pass
+
+    def reap(self):
+        """
+        requeues claims not touched for lease seconds; a unit that has
+        used up max_attempts goes to failed/. Returns the ids requeued.
+        """
+        out = []
+        now = time.time()
+        for uid in self.ids("claimed"):
+            fn = self.path("claimed", uid)
+            try:
+                if now - os.path.getmtime(fn) < self.lease:
+                    continue
+                # in place, then one rename: the unit is in exactly one of
+                # claimed/ and todo/ at any time, whoever claims it meanwhile
+                with open(fn, "r+") as f:
+                    unit = json.load(f)
+                    unit["attempts"] += 1
+                    unit.pop("worker", None)
+                    f.seek(0)
+                    json.dump(unit, f, sort_keys=True)
+                    f.truncate()
+                dest = "todo" if unit["attempts"] < self.max_attempts else "failed"
+                os.rename(fn, self.path(dest, uid))
+            except (OSError, IOError, ValueError):
+                continue # completed (or reaped elsewhere) meanwhile
+            if dest == "todo":
+                out.append(uid)
+        return out
+
+    def counts(self):
+        return dict((d, len(self.ids(d))) for d in self.dirs)
+
+    def merge(self, ids=None):
+        """
+        {(config json, seating, seed): rows of every done unit, by game number}
+        ids: only these units (default: all done)
+        """
+        done = set(self.ids("done"))
+        groups = {}
+        for uid in (ids if ids is not None else done):
+            if uid not in done:
+                continue
+            rows = np.load(self.path("done", uid))
+            with open(self.path("done", uid)[:-4] + ".json") as f:
+                unit = json.load(f)
+            key = (json.dumps(unit["config"], sort_keys=True), tuple(unit["players"]), unit["seed"])
+            groups.setdefault(key, []).append(rows)
+        return dict((k, np.sort(np.concatenate(v), order="game")) for k, v in groups.iteritems())
+
+def work(root, lease=60, idle_exit=None, poll=1.0):
+    """
+    claims and plays units until todo stays empty for idle_exit seconds
+    (or forever); a background thread touches the claim every lease/3
+    seconds, so a claim only goes stale if this process dies or hangs
+    """
+    q = WorkQueue(root, lease)
+    worker = "{0}:{1}".format(socket.gethostname(), os.getpid())
+    idle_since = time.time()
+    while idle_exit is None or time.time() - idle_since < idle_exit:
+        got = q.claim(worker)
+        if got is None:
+            time.sleep(poll)
+            continue
+        uid, unit = got
+        stop = threading.Event()
+        def heartbeat():
+            while not stop.wait(lease/3.0):
+                q.touch(uid)
+        t = threading.Thread(target=heartbeat)
+        t.daemon = True
+        t.start()
+        try:
+            rows = []
+            play_results(unit["players"], unit["seed"], unit["start"], unit["stop"], True, unit["config"], rows=rows)
+            # the unit description next to the result, for merge
+            write_json(q.path("done", uid)[:-4] + ".json", dict((k, unit[k]) for k in ["config", "players", "seed", "start", "stop"]))
+            q.complete(uid, to_rows(rows, unit["start"], len(unit["players"])))
+        finally:
+            stop.set()
+        idle_since = time.time()
+
+def dispatch(root, runs, unit_size=2000, nworkers=2, lease=60, max_attempts=3, poll=1.0):
+    """
+    submits runs, keeps nworkers local worker processes alive (standing in
+    for other nodes, which may also work on root) and reaps dead claims
+    until every unit is done or failed; returns WorkQueue.merge of the runs
+    """
+    q = WorkQueue(root, lease, max_attempts)
+    ids = q.submit(make_units(runs, unit_size))
+    procs = []
+    try:
+        while True:
+            q.reap()
+            c = q.counts()
+            left = [uid for uid in ids if not os.path.exists(q.path("done", uid)) and not os.path.exists(q.path("failed", uid))]
+            if not left:
+                break
+            procs = [p for p in procs if p.is_alive()]
+            while len(procs) < min(nworkers, c["todo"] + c["claimed"]):
+                p = multiprocessing.Process(target=work, args=(root, lease, 2*poll, poll))
+                p.daemon = True
+                p.start()
+                procs.append(p)
+            time.sleep(poll)
+    finally:
+        for p in procs:
+            p.terminate()
+            p.join()
+    c = q.counts()
+    if c["failed"]:
+        print "{0} units failed after {1} attempts".format(c["failed"], max_attempts)
+    return q.merge(ids)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["work", "run"])
+    parser.add_argument("root", help="queue directory, shared by every node")
+    parser.add_argument("--players", default="selfish,generous", help="comma-separated seating (run)")
+    parser.add_argument("--ngames", type=int, default=20000, help="games per run (run)")
+    parser.add_argument("--ntrees", default="5,9", help="comma-separated values, one run each (run)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--unit-size", type=int, default=2000)
+    parser.add_argument("--nworkers", type=int, default=2, help="local workers (run)")
+    parser.add_argument("--lease", type=float, default=60, help="seconds before a silent claim is requeued")
+    args = parser.parse_args(argv)
+    if args.mode == "work":
+        work(args.root, args.lease)
+        return
+    runs = [({"ntrees": int(n)}, args.players.split(","), args.seed, args.ngames) for n in args.ntrees.split(",")]
+    for (config, players, seed), rows in sorted(dispatch(args.root, runs, args.unit_size, args.nworkers, args.lease).iteritems()):
+        print "=================="
+        print "{0} seed {1} ntrees {2}".format(list(players), seed, json.loads(config)["ntrees"])
+        print_summary(rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Events emitted by Game to its listeners.
+
+A listener is any callable taking one event. Events hold only the values
+of what happened; their text is built by format() when a listener asks
+for it, so listeners that count or record never pay for formatting.
+Game builds no events at all when it has no listeners.
+"""
+import collections
+
+class Event(object):
+    __slots__ = ["turn"]
+
+    def format(self):
+        raise NotImplementedError
+
+    def __str__(self):
+        return self.format()
+
+class GameStart(Event):
+    __slots__ = ["board", "players"]
+
+    def __init__(self, board, players):
+        """
+        board: the board as dealt; players: the game's model.Players
+        """
+        self.turn = 0
+        self.board = board
+        self.players = players
+
+    def format(self):
+        return "Game started with {0} trees: {1}".format(self.board.ntrees, ', '.join([p.name for p in self.players.players]))
+
+class TurnEvent(Event):
+    __slots__ = ["player"]
+
+class Draw(TurnEvent):
+    __slots__ = ["card"]
+
+    def __init__(self, turn, player, card):
+        self.turn = turn
+        self.player = player
+        self.card = card
+
+    def format(self):
+        return "P({0}): draw {1}".format(self.player.name, self.card)
+
+class Garden(TurnEvent):
+    __slots__ = ["r", "c", "n"]
+
+    def __init__(self, turn, player, r, c, n):
+        """
+        n: trees added to tile (r, c): 1, plus hut_multiplier per hut touching it
+        """
+        self.turn = turn
+        self.player = player
+        self.r = r
+        self.c = c
+        self.n = n
+
+    def format(self):
+        return "P({0}): draw garden at ({1}, {2}), +{3} trees".format(self.player.name, self.r, self.c, self.n)
+
+class Curse(TurnEvent):
+    __slots__ = ["r", "c", "n", "vps", "add_curse"]
+
+    def __init__(self, turn, player, r, c, n, vps, add_curse):
+        """
+        n: trees removed; vps: {player index: VPs gained}
+        add_curse: whether the tile ran out, adding a curse to the deck
+        """
+        self.turn = turn
+        self.player = player
+        self.r = r
+        self.c = c
+        self.n = n
+        self.vps = vps
+        self.add_curse = add_curse
+
+    def format(self):
+        vps = ', '.join(["P{0} +{1}".format(i, v) for i,v in sorted(self.vps.iteritems())])
+        return "P({0}): draw curse on ({1}, {2}), -{3} trees{4}{5}".format(self.player.name, self.r, self.c, self.n, "; VPs " + vps if vps else "", "; curse added" if self.add_curse else "")
+
+class Buy(TurnEvent):
+    __slots__ = ["acts", "cost"]
+
+    def __init__(self, turn, player, acts, cost):
+        """
+        acts: [(object name, (i,j)), ...]
+        """
+        self.turn = turn
+        self.player = player
+        self.acts = acts
+        self.cost = cost
+
+    def format(self):
+        return "P({0}): buy {1} for ${2}".format(self.player.name, ', '.join(["{0} at {1}".format(nm, pos) for nm,pos in self.acts]), self.cost)
+
+class GameEnd(Event):
+    __slots__ = ["status", "winner", "players", "vps"]
+
+    def __init__(self, nturns, status, winner, players, vps):
+        """
+        winner: the winning player, or None
+        vps: final VPs in seat order
+        """
+        self.turn = nturns
+        self.status = status
+        self.winner = winner
+        self.players = players
+        self.vps = vps
+
+    def format(self):
+        return "Game ended after {0} turns: {1}{2}, VPs {3}".format(self.turn, self.status, " by Player " + self.winner.name if self.winner is not None else "", '-'.join([str(v) for v in self.vps]))
+
+class ConsoleListener:
+    """
+    prints the board, the action and the player's status after every turn,
+    as Game(verbose=True) does
+    """
+    def __init__(self, board, players=None):
+        self.board = board
+        self.players = players
+
+    def __call__(self, event):
+        if isinstance(event, GameStart):
+            self.players = event.players
+        elif isinstance(event, (Garden, Curse, Buy)):
+            print self.board.tiles
+            print event.format()
+            print self.players.player_status(event.player.index)
+
+class EventCounter:
+    """
+    counts events by type, and cards drawn by name
+    """
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def __call__(self, event):
+        self.counts[event.__class__.__name__] += 1
+        if isinstance(event, Draw):
+            self.counts[event.card] += 1
@@ -0,0 +1,207 @@
+"""
+Genetic search over strategy vectors (player.PARAMS).
+
+A candidate's fitness is its win rate against a pool of player types,
+playing both seats of every matchup on the same seeds with the batch
+engine. Candidates of a generation are scored in a process pool.
+Fitnesses are memoized on disk under the sha1 of (params, opponents,
+seed, ngames, objective, config), as least-recently-used files in
+cache_dir, so elites and repeated candidates are never replayed. The
+search writes a checkpoint after every generation and resumes from it.
+
+    python evolve.py --generations 30 --opponents selfish,reasonable
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import pickle
+import numpy as np
+from batch import BatchGame
+from game import PLAYER_TYPES, make_game, get_config
+from player import DefaultPlayer, PARAMS, PRESETS
+from runner import game_seed
+
+# (low, high) per entry of PARAMS: probabilities, then trees to keep
+BOUNDS = np.array([[0, 1]]*(len(PARAMS)-1) + [[0, 3]], dtype=float)
+OBJECTIVES = ["win", "survive"] # our wins, or games the commons survives (not LOSS)
+
+def fitness_key(params, opponents, seed, ngames, objective, config):
+    desc = {"params": [round(float(v), 6) for v in params], "opponents": list(opponents), "seed": seed,
+        "ngames": ngames, "objective": objective, "config": get_config(config)}
+    desc["config"]["shape"] = list(desc["config"]["shape"])
+    return hashlib.sha1(json.dumps(desc, sort_keys=True)).hexdigest()
+
+def fitness(args):
+    """
+    args: (params, opponents, seed, ngames, objective, config)
+    returns the share of games won (or not lost, for "survive") over
+    ngames games per seat per opponent
+    """
+    params, opponents, seed, ngames, objective, config = args
+    g = make_game(config=config)
+    bg = BatchGame(g.board, g.deck, g.max_nturns, g.vps_to_win)
+    seeds = [game_seed(seed, i) for i in xrange(ngames)]
+    score = 0
+    for opp in opponents:
+        for seat in [0, 1]:
+            ps = [PLAYER_TYPES[opp](2-seat, opp)]
+            ps.insert(seat, DefaultPlayer(seat+1, "evolved", params))
+            for status, winner in bg.play(ps, seeds):
+                if objective == "win":
+                    score += status == "WIN" and winner == "evolved"
+                else:
+                    score += status != "LOSS"
+    return score/float(2*ngames*len(opponents))
+
+class FitnessCache:
+    def __init__(self, cache_dir, max_entries=100000):
+        """
+        one small JSON file per fitness in cache_dir; a hit refreshes the
+        file's mtime, and the oldest files are dropped past max_entries
+        """
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self.nentries = len([fn for fn in os.listdir(cache_dir) if fn.endswith(".json")])
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        fn = os.path.join(self.cache_dir, key + ".json")
+        if not os.path.exists(fn):
+            self.misses += 1
+            return None
+        with open(fn) as f:
+            v = json.load(f)["fitness"]
+        os.utime(fn, None)
+        self.hits += 1
+        return v
+
+    def put(self, key, v):
+        # write-then-rename, as sweep.save_cell
+        fn = os.path.join(self.cache_dir, key + ".json")
+        with open(fn + ".tmp", "w") as f:
+            json.dump({"fitness": v}, f)
+        os.rename(fn + ".tmp", fn)
+        self.nentries += 1
+        if self.nentries > self.max_entries:
+            self.evict()
+
+    def evict(self):
+        # down to 90% of max_entries, so eviction runs once per many puts
+        fns = [os.path.join(self.cache_dir, fn) for fn in os.listdir(self.cache_dir) if fn.endswith(".json")]
+        fns.sort(key=os.path.getmtime)
+        keep = int(0.9*self.max_entries)
+        for fn in fns[:max(0, len(fns) - keep)]:
+            os.remove(fn)
+        self.nentries = min(len(fns), keep)
+
+def clip(params):
+    return np.clip(params, BOUNDS[:,0], BOUNDS[:,1])
+
+def initial_population(pop_size, rng):
+    # the presets, then uniform samples
+    pop = [np.array(PRESETS[name], dtype=float) for name in sorted(PRESETS)][:pop_size]
+    while len(pop) < pop_size:
+        pop.append(BOUNDS[:,0] + rng.rand(len(PARAMS))*(BOUNDS[:,1] - BOUNDS[:,0]))
+    return pop
+
+def breed(pop, fits, rng, nelite=2, tournament=3, mutation=0.15):
+    """
+    the next population: the nelite best, then children of tournament-
+    selected parents by blend crossover and Gaussian mutation
+    """
+    order = np.argsort(fits)[::-1]
+    out = [pop[k] for k in order[:nelite]]
+    def select():
+        ks = rng.randint(len(pop), size=tournament)
+        return pop[ks[np.argmax([fits[k] for k in ks])]]
+    while len(out) < len(pop):
+        a, b = select(), select()
+        w = rng.rand(len(PARAMS))
+        child = w*a + (1-w)*b + rng.randn(len(PARAMS))*mutation*(BOUNDS[:,1] - BOUNDS[:,0])
+        out.append(clip(child))
+    return out
+
+def save_checkpoint(fn, state):
+    with open(fn + ".tmp", "wb") as f:
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+    os.rename(fn + ".tmp", fn)
+
+def search(opponents=("selfish",), pop_size=24, ngenerations=30, ngames=200, seed=0, objective="win", config=None,
+        nworkers=None, cache_dir="evolve_cache", max_cache=100000, checkpoint="evolve.ckpt", nelite=2, mutation=0.15):
+    """
+    returns (best params, best fitness, history of (generation, best, mean fitness))
+    seed: seeds the games (the same for every candidate) and the search
+    checkpoint: file to resume from and save to after every generation; None to disable
+    """
+    assert objective in OBJECTIVES
+    opponents = list(opponents)
+    cache = FitnessCache(cache_dir, max_cache) if cache_dir else None
+    if checkpoint and os.path.exists(checkpoint):
+        with open(checkpoint, "rb") as f:
+            state = pickle.load(f)
+        print "resuming at generation {0}".format(state["generation"])
+    else:
+        rng = np.random.RandomState(seed)
+        state = {"generation": 0, "pop": initial_population(pop_size, rng), "rng": rng.get_state(), "history": [], "best": (None, -1.0)}
+    rng = np.random.RandomState()
+    rng.set_state(state["rng"])
+
+    nworkers = nworkers if nworkers is not None else multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(nworkers) if nworkers > 1 else None
+    try:
+        while state["generation"] < ngenerations:
+            pop = state["pop"]
+            keys = [fitness_key(p, opponents, seed, ngames, objective, config) for p in pop]
+            fits = [cache.get(k) if cache else None for k in keys]
+            todo = [k for k, v in enumerate(fits) if v is None]
+            args = [(pop[k].tolist(), opponents, seed, ngames, objective, config) for k in todo]
+            for k, v in zip(todo, (pool.map if pool else map)(fitness, args)):
+                fits[k] = v
+                if cache:
+                    cache.put(keys[k], v)
+
+            k = int(np.argmax(fits))
+            if fits[k] > state["best"][1]:
+                state["best"] = (pop[k].copy(), fits[k])
+            state["history"].append((state["generation"], max(fits), float(np.mean(fits))))
+            print "generation {0}: best {1:.3f}, mean {2:.3f}, {3} played, best so far {4:.3f} {5}".format(
+                state["generation"], max(fits), np.mean(fits), len(todo), state["best"][1], np.round(state["best"][0], 2).tolist())
+
+            state["pop"] = breed(pop, fits, rng, nelite, mutation=mutation)
+            state["rng"] = rng.get_state()
+            state["generation"] += 1
+            if checkpoint:
+                save_checkpoint(checkpoint, state)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    return state["best"][0], state["best"][1], state["history"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--opponents", default="selfish", help="comma-separated player types to score against")
+    parser.add_argument("--objective", default="win", choices=OBJECTIVES)
+    parser.add_argument("--pop-size", type=int, default=24)
+    parser.add_argument("--generations", type=int, default=30)
+    parser.add_argument("--ngames", type=int, default=200, help="games per seat per opponent")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--nworkers", type=int, help="pool size (default: the cpu count)")
+    parser.add_argument("--cache-dir", default="evolve_cache")
+    parser.add_argument("--max-cache", type=int, default=100000)
+    parser.add_argument("--checkpoint", default="evolve.ckpt")
+    args = parser.parse_args(argv)
+    best, fit, history = search(args.opponents.split(","), args.pop_size, args.generations, args.ngames, args.seed, args.objective,
+        nworkers=args.nworkers, cache_dir=args.cache_dir, max_cache=args.max_cache, checkpoint=args.checkpoint)
+    print "=================="
+    print "best {0:.3f}:".format(fit)
+    for name, v in zip(PARAMS, best):
+        print "    {0}: {1:.3f}".format(name, v)
+
+if __name__ == '__main__':
+    main()
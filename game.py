@@ -1,22 +1,46 @@
 from player import DefaultPlayer, SelfishPlayer, SuperSelfishPlayer, GenerousPlayer, ReasonablePlayer, CautiousPlayer
-from model import Game, Deck, Board
+import collections
+import numpy as np
+from model import Game, Deck, CountingDeck, Board, VPS, MONEY, MONEY_SCALE
+from stats import GameStats
+
+PLAYER_TYPES = {"generous": GenerousPlayer, "selfish": SelfishPlayer, "default": DefaultPlayer, "super-selfish": SuperSelfishPlayer, "reasonable": ReasonablePlayer, "cautious": CautiousPlayer}
 
 def get_players(ptypes):
-    plkp = {"generous": GenerousPlayer, "selfish": SelfishPlayer, "default": DefaultPlayer, "super-selfish": SuperSelfishPlayer, "reasonable": ReasonablePlayer, "cautious": CautiousPlayer}
     ps = []
     for i,p in enumerate(ptypes):
-        ps.append(plkp[p](i+1, p + "-" + str(i+1)))
+        ps.append(PLAYER_TYPES[p](i+1, p + "-" + str(i+1)))
     return ps
 
+GAME_CONFIG = {
+    "shape": (6,6),
+    "cost_of_hut": 0.05,
+    "cost_of_station": 3,
+    "ntrees": 9,
+    "ngardens": 3,
+    "ncurses": 3,
+    "vps_to_win": 11,
+    "max_nturns": 200,
+}
+
+def get_config(config=None):
+    """
+    GAME_CONFIG with the entries of config overriding the defaults
+    """
+    cfg = dict(GAME_CONFIG)
+    cfg.update(config or {})
+    return cfg
+
+def make_game(rng=None, verbose=False, counting_deck=False, config=None):
+    cfg = get_config(config)
+    board = Board(tuple(cfg["shape"]), {"hut": cfg["cost_of_hut"], "station": cfg["cost_of_station"]}, ntrees=cfg["ntrees"], rng=rng)
+    deck_cls = CountingDeck if counting_deck else Deck
+    deck = deck_cls({"garden": cfg["ngardens"], "curse": cfg["ncurses"]}, rng=rng)
+    return Game(board, deck, max_nturns=cfg["max_nturns"], vps_to_win=cfg["vps_to_win"], verbose=verbose)
+
 def play_game(ngames=100):
     verbose = ngames == 1
 
-    cost_of_hut = 0.05
-    cost_of_station = 3
-    ntrees = 9
-    ngardens = 3
-    ncurses = 3
-
     """
     IDEAL GAME SCENARIOS:
         selfish vs. selfish: RARELY WIN
@@ -38,22 +62,23 @@ def play_game(ngames=100):
     # player_types = ["generous", "generous"] # 0/10
     # player_types = ["reasonable", "reasonable"] # 0/10
 
-    board = Board((6,6), {"hut": cost_of_hut, "station": cost_of_station}, ntrees=ntrees)
-    deck = Deck({"garden": ngardens, "curse": ncurses})
-    g = Game(board, deck, verbose=verbose)
+    g = make_game(verbose=verbose)
     ps = get_players(player_types)
-    ss = []
-    ws = []
+    ss = collections.Counter()
+    ws = collections.Counter()
+    gs = GameStats(len(ps), g.max_nturns)
     for i in xrange(ngames):
         status, winner = g.play(ps, print_end_status=False)
-        ss.append(status)
-        ws.append(winner)
+        ss[status] += 1
+        ws[winner] += 1
+        gs.update(g.nturns, g.final_players.stats[VPS], g.final_players.stats[MONEY]/float(MONEY_SCALE), status == "MAX_ITERS")
         g.reset()
 
-    import collections
     print '=================='
-    print collections.Counter(ws)
-    print collections.Counter(ss)
+    print ws
+    print ss
+    gs.print_summary()
+    return ws, ss, gs
 
 if __name__ == '__main__':
     play_game()
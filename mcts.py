@@ -0,0 +1,277 @@
+"""
+Monte Carlo search player.
+
+At each decision MCTSPlayer lists candidate actions (every curse
+target/amount, and the purchases the heuristic players would make),
+then spends its time budget on rollouts allocated by UCB1 at the root:
+each rollout starts from the current position, plays the candidate, and
+finishes the game with heuristic players as the rollout policies.
+Rollouts never see the real deck order; each shuffles the draw pile
+from its card counts with its own seed.
+
+Two rollout engines: "batch" plays rounds of rollouts in lockstep with
+batch.BatchGame.play_from; "serial" plays one rollout at a time on a
+Board/CountingDeck/Players that are restored from snapshots in between.
+With nworkers > 1, every worker searches the same candidates for the
+same budget and their counts are summed (root parallelization).
+"""
+import multiprocessing
+import time
+import numpy as np
+from model import Game, Board, CountingDeck, Players, MONEY, VPS, HUTS, STATIONS, MONEY_SCALE
+from batch import BatchGame, CARD_CODES, HUT, STATION
+from player import DefaultPlayer, ReasonablePlayer, BUY_POLICIES
+
+class FixedAction:
+    def __init__(self, index, action):
+        self.index = index
+        self.action = action
+
+    def take_action(self, board, cur_money):
+        return self.action
+
+def curse_amounts(ntrees):
+    return sorted(set([1, min(2, ntrees), max(1, ntrees-1), ntrees]))
+
+def ucb(means, visits, c):
+    return means + c*np.sqrt(np.log(max(visits.sum(), 1))/np.maximum(visits, 1e-9))
+
+def search_serial(state, candidates, budget, max_rollouts, seed, c=0.7):
+    """
+    state: what a rollout needs to rebuild the game, see MCTSPlayer.search_state
+    returns (visits, total reward) per candidate
+    """
+    rng = np.random.RandomState(seed)
+    board = Board(state["shape"], state["obj_cost"], ntrees=0, rng=rng)
+    board.restore(state["board"])
+    deck = CountingDeck(state["card_info"], rng=rng)
+    deck.set_counts(*state["deck"])
+    seats = [cls(index) for index, cls in state["seats"]]
+    Ps = Players(seats)
+    Ps.restore(state["stats"])
+    sim = Game(board, deck, state["max_nturns"], state["vps_to_win"])
+    b0, d0, s0 = board.snapshot(), deck.snapshot(), Ps.snapshot()
+    me = [p.index for p in seats].index(state["index"])
+    turn = state["turn"]
+
+    n = len(candidates)
+    visits = np.zeros(n)
+    rewards = np.zeros(n)
+    t0 = time.time()
+    k = 0
+    while k < max_rollouts and (k < n or time.time() - t0 < budget):
+        a = k if k < n else ucb(rewards/np.maximum(visits, 1), visits, c).argmax()
+        board.restore(b0)
+        deck.restore(d0)
+        Ps.restore(s0)
+        for p in seats:
+            p.purchases = list(state["purchases"][p.index])
+        act_name, acts = candidates[a]
+        sim.turn = turn
+        sim.next_turn(FixedAction(state["index"], candidates[a]), Ps)
+        if act_name == "buy":
+            seats[me].purchases.extend(acts)
+        for i in xrange(turn+1, state["max_nturns"]):
+            if sim.game_is_over():
+                break
+            sim.turn = i
+            sim.next_turn(seats[i % len(seats)], Ps)
+        vps = Ps.stats[VPS]
+        if sim.game_is_win(Ps) and vps[me] == vps.max():
+            rewards[a] += 1.0/(vps == vps[me]).sum()
+        visits[a] += 1
+        k += 1
+    return visits, rewards
+
+def batch_starts(state, candidates):
+    """
+    stacked per-candidate start positions for BatchGame.play_from: the
+    position after a buy, or the current one plus a forced curse target
+    """
+    nrows, ncols = state["shape"]
+    tiles, grid = state["board"][:2]
+    stats = state["stats"]
+    seats = [index for index, cls in state["seats"]]
+    me = seats.index(state["index"])
+    last = [{"hut": HUT, "station": STATION}[state["purchases"][i][-1][0]] if state["purchases"][i] else 0 for i in seats]
+    draw, discard = [np.zeros(len(CARD_CODES), dtype=int) for k in xrange(2)]
+    for name, code in CARD_CODES.iteritems():
+        draw[code] = state["deck"][0][name]
+        discard[code] = state["deck"][1][name]
+
+    rows = []
+    curse_inds = -np.ones(len(candidates), dtype=int)
+    curse_n = np.zeros(len(candidates), dtype=int)
+    for a, (act_name, acts) in enumerate(candidates):
+        row = {"tiles": tiles.ravel(), "grid": grid.ravel().copy(), "money": stats[MONEY].copy(), "vps": stats[VPS],
+            "huts": stats[HUTS].copy(), "stations": stats[STATIONS].copy(), "last": np.array(last), "draw": draw, "discard": discard}
+        if act_name == "draw":
+            r, c, n = acts
+            curse_inds[a] = r*ncols + c
+            curse_n[a] = n
+        else:
+            for nm, (i,j) in acts:
+                row["grid"][i*(ncols-1) + j] = -1 if nm == "hut" else state["index"]
+                row["huts" if nm == "hut" else "stations"][me] += 1
+            row["money"][me] -= int(round(sum([state["obj_cost"][nm] for nm, pos in acts])*MONEY_SCALE))
+            row["last"][me] = HUT if acts[-1][0] == "hut" else STATION
+        rows.append(row)
+    starts = dict((k, np.array([row[k] for row in rows])) for k in rows[0])
+    starts["turn"] = state["turn"]
+    return starts, curse_inds, curse_n
+
+def search_batch(state, candidates, budget, max_rollouts, seed, c=0.7, round_size=256, chunk=16):
+    """
+    as search_serial, in rounds of round_size rollouts; each round hands
+    out chunks of rollouts by UCB1, counting the round's earlier chunks as visits
+    """
+    rng = np.random.RandomState(seed)
+    proto = Board(state["shape"], state["obj_cost"], ntrees=0)
+    bg = BatchGame(proto, CountingDeck(state["card_info"]), state["max_nturns"], state["vps_to_win"])
+    seats = [cls(index) for index, cls in state["seats"]]
+    me = [p.index for p in seats].index(state["index"])
+    starts, curse_inds, curse_n = batch_starts(state, candidates)
+
+    n = len(candidates)
+    visits = np.zeros(n)
+    rewards = np.zeros(n)
+    t0 = time.time()
+    while visits.sum() < max_rollouts and (visits.sum() == 0 or time.time() - t0 < budget):
+        if visits.sum() == 0:
+            alloc = np.repeat(np.arange(n), max(1, round_size/n))
+        else:
+            means = rewards/np.maximum(visits, 1)
+            pending = np.zeros(n)
+            for k in xrange(round_size/chunk):
+                pending[ucb(means, visits + pending, c).argmax()] += chunk
+            alloc = np.repeat(np.arange(n), pending.astype(int))
+        alloc = alloc[:int(max_rollouts - visits.sum())]
+        start = dict((k, v[alloc]) for k, v in starts.iteritems() if k != "turn")
+        start["turn"] = starts["turn"]
+        bg.play_from(seats, rng.randint(2**31, size=len(alloc)), start, curse_inds[alloc], curse_n[alloc])
+        vps = bg.vps
+        vmax = vps.max(axis=1)
+        won = (vps.sum(axis=1) >= state["vps_to_win"]) & (vps[:, me] == vmax)
+        reward = np.where(won, 1.0/(vps == vmax[:, None]).sum(axis=1), 0)
+        visits += np.bincount(alloc, minlength=n)
+        rewards += np.bincount(alloc, weights=reward, minlength=n)
+    return visits, rewards
+
+SEARCH_ENGINES = {"batch": search_batch, "serial": search_serial}
+
+def search_unit(args):
+    engine, args = args
+    return SEARCH_ENGINES[engine](*args)
+
+class MCTSPlayer(DefaultPlayer):
+    def __init__(self, index, name=None, budget=1.0, max_rollouts=100000, rollout_policy=ReasonablePlayer, engine="batch", nworkers=1, c=0.7, seed=None):
+        """
+        budget: seconds of rollouts per decision
+        engine: "batch" or "serial" rollouts
+        rollout_policy: plays this player's seat in rollouts; opponents
+            play as their own class (or their rollout_policy)
+        nworkers: rollout processes; the pool is kept for the player's lifetime
+        """
+        DefaultPlayer.__init__(self, index, name)
+        self.budget = budget
+        self.max_rollouts = max_rollouts
+        self.rollout_policy = rollout_policy
+        self.engine = engine
+        self.nworkers = nworkers
+        self.c = c
+        self.rng = np.random.RandomState(seed)
+        self.pool = None
+        self.nrollouts = [] # per decision
+
+    def start_game(self, game, Ps):
+        self.game = game
+        self.Ps = Ps
+        self.purchases = []
+
+    def candidates(self, board, cur_money):
+        cands = [("draw", (r, c, n)) for r, c, t in board.valid_curse_inds() for n in curse_amounts(t)]
+        if cur_money < min(board.obj_cost.values()):
+            return cands
+        seen = set()
+        for cls in BUY_POLICIES:
+            q = cls(self.index)
+            q.purchases = list(self.purchases)
+            acts = q.buy_objects(board, cur_money)
+            # and the heuristic's first object alone, saving the rest
+            for acts in [acts, acts[:1]]:
+                if acts and acts[0][1] is not None and tuple(acts) not in seen:
+                    seen.add(tuple(acts))
+                    cands.append(("buy", acts))
+        return cands
+
+    def search_state(self, board):
+        seats = []
+        for p in self.Ps.players:
+            if p is self:
+                cls = self.rollout_policy
+            else:
+                cls = getattr(p, "rollout_policy", p.__class__)
+            seats.append((p.index, cls))
+        return {
+            "shape": (board.nrows, board.ncols),
+            "obj_cost": board.obj_cost,
+            "board": board.snapshot(),
+            "card_info": self.game.deck.card_info,
+            "deck": self.game.deck.counts(),
+            "stats": self.Ps.snapshot(),
+            "seats": seats,
+            "purchases": dict((p.index, list(p.purchases)) for p in self.Ps.players),
+            "index": self.index,
+            "turn": self.game.turn,
+            "max_nturns": self.game.max_nturns,
+            "vps_to_win": self.game.vps_to_win,
+        }
+
+    def take_action(self, board, cur_money):
+        # candidates use the heuristics' tie-breaks; keep them off the game's rng
+        rng, board.rng = board.rng, self.rng
+        try:
+            cands = self.candidates(board, cur_money)
+        finally:
+            board.rng = rng
+        if len(cands) == 1:
+            a = 0
+        else:
+            state = self.search_state(board)
+            seeds = self.rng.randint(2**31, size=self.nworkers)
+            args = [(self.engine, (state, cands, self.budget, self.max_rollouts/self.nworkers, s, self.c)) for s in seeds]
+            if self.nworkers > 1:
+                if self.pool is None:
+                    self.pool = multiprocessing.Pool(self.nworkers)
+                results = self.pool.map(search_unit, args)
+            else:
+                results = [search_unit(args[0])]
+            visits = sum([v for v, r in results])
+            self.nrollouts.append(int(visits.sum()))
+            a = visits.argmax()
+        act_name, acts = cands[a]
+        if act_name == "buy":
+            self.purchases.extend(acts)
+        return act_name, acts
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+if __name__ == '__main__':
+    import collections
+    from game import make_game, get_players
+    ngames = 10
+    for ptype in ["selfish", "reasonable"]:
+        for engine in ["batch", "serial"]:
+            ws = collections.Counter()
+            nrollouts = []
+            for i in xrange(ngames):
+                g = make_game(rng=np.random.RandomState([0, i]))
+                mcts = MCTSPlayer(1, "mcts-1", budget=0.2, engine=engine, seed=i)
+                status, winner = g.play([mcts, get_players(["selfish", ptype])[1]], print_end_status=False)
+                ws[winner] += 1
+                nrollouts.extend(mcts.nrollouts)
+            print "mcts ({0}) vs {1}: {2}, median rollouts per decision {3}".format(engine, ptype, dict(ws), np.median(nrollouts))
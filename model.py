@@ -1,64 +1,150 @@
 import numpy as np
 import collections
+import heapq
+import bisect
+from events import GameStart, Draw, Garden, Curse, Buy, GameEnd, ConsoleListener
+
+MONEY, VPS, HUTS, STATIONS = range(4) # rows of Players.stats
+MONEY_SCALE = 100 # money is stored in hundredths
+
+def cannot_clear(ntiles, draw, discard, nturns_left):
+    """
+    True if ntiles tiles with trees provably cannot all be cleared within
+    nturns_left more turns, whatever the players do. Every tile needs a
+    curse of its own, so this counts the fewest turns that many curses
+    take to draw: each pass through the deck draws its curses before its
+    gardens, and every curse empties a tile, adding a curse for the next pass.
+    draw, discard: (gardens, curses) in the draw and discard piles
+    """
+    gardens, curses = draw
+    total_gardens = gardens + discard[0]
+    outside = discard[1] # curses not in the draw pile
+    turns = 0
+    while turns <= nturns_left:
+        if ntiles <= curses:
+            return turns + ntiles > nturns_left
+        if curses + outside == 0:
+            return True
+        # the rest of this pass is gardens, then the discard is reshuffled
+        turns += curses + gardens
+        ntiles -= curses
+        curses, outside, gardens = outside + 2*curses, 0, total_gardens
+    return True
+
+class Players(object):
+    __slots__ = ["players", "cols", "stats", "top_vps", "ntop", "leader", "total_vps"]
 
-class Players:
     def __init__(self, players):
         self.players = players
+        # column of every player index (indices are small ints, see validate)
+        self.cols = [-1]*(max([p.index for p in players]) + 1)
+        for k,p in enumerate(players):
+            self.cols[p.index] = k
         self.init()
 
     def init(self):
-        self.vps = dict((p.index, 0) for p in self.players)
-        self.money = dict((p.index, 0) for p in self.players)
-        self.huts = dict((p.index, 0) for p in self.players)
-        self.stations = dict((p.index, 0) for p in self.players)
+        # one column per player, in seat order
+        self.stats = np.zeros([4, len(self.players)], dtype=np.int32)
+        self.init_leader()
+
+    def init_leader(self):
+        """
+        top_vps: the most VPs of any player, held by ntop players
+        leader: the column of one of them
+        total_vps: VPs of all players
+        VPs only grow, so update_vps keeps these current in O(1)
+        """
+        vps = self.stats[VPS]
+        self.leader = int(vps.argmax())
+        self.top_vps = int(vps[self.leader])
+        self.ntop = int((vps == self.top_vps).sum())
+        self.total_vps = int(vps.sum())
+
+    def stat_dict(self, row):
+        return dict((p.index, int(v)) for p,v in zip(self.players, self.stats[row]))
+
+    @property
+    def vps(self):
+        return self.stat_dict(VPS)
+
+    @property
+    def money(self):
+        return dict((i, v/float(MONEY_SCALE)) for i,v in self.stat_dict(MONEY).iteritems())
+
+    @property
+    def huts(self):
+        return self.stat_dict(HUTS)
+
+    @property
+    def stations(self):
+        return self.stat_dict(STATIONS)
 
     def get_money(self, player_index):
-        return self.money[player_index]
+        return self.stats.item(MONEY, self.cols[player_index])/float(MONEY_SCALE)
 
     def get_vps(self, player_index):
-        return self.vps[player_index]
+        return self.stats.item(VPS, self.cols[player_index])
 
     def update_money(self, player_index, delta):
         assert delta != 0
+        delta = int(round(delta*MONEY_SCALE))
+        k = self.cols[player_index]
         if delta < 0:
-            assert self.money[player_index] >= abs(delta)
-        self.money[player_index] += delta
+            assert self.stats.item(MONEY, k) >= abs(delta)
+        self.stats[MONEY, k] += delta
 
     def update_vps(self, player_index, delta):
         assert delta > 0
-        self.vps[player_index] += delta
+        k = self.cols[player_index]
+        v = self.stats.item(VPS, k) + delta
+        self.stats[VPS, k] = v
+        self.total_vps += delta
+        if v > self.top_vps:
+            self.top_vps, self.ntop, self.leader = v, 1, k
+        elif v == self.top_vps:
+            self.ntop += 1
 
     def update_purchases(self, player_index, acts):
+        k = self.cols[player_index]
         for nm, _ in acts:
             if nm == "hut":
-                self.huts[player_index] += 1
+                self.stats[HUTS, k] += 1
             elif nm == "station":
-                self.stations[player_index] += 1
+                self.stats[STATIONS, k] += 1
             else:
                 assert False
 
     def player_status(self, player_index):
-        p = [p for p in self.players if p.index == player_index][0]
-        return "P({0}): ${1}, {2} VPs, {3} huts, {4} stations".format(p.name, self.money[p.index], self.vps[p.index], self.huts[p.index], self.stations[p.index])
+        k = self.cols[player_index]
+        p = self.players[k]
+        return "P({0}): ${1}, {2} VPs, {3} huts, {4} stations".format(p.name, self.get_money(p.index), self.stats[VPS, k], self.stats[HUTS, k], self.stats[STATIONS, k])
+
+    def snapshot(self):
+        return self.stats.copy()
+
+    def restore(self, snap):
+        np.copyto(self.stats, snap)
+        self.init_leader()
 
     def player_with_most_vps(self):
-        vmax = -1
-        imax = -1
-        for i,v in self.vps.iteritems():
-            if v > vmax:
-                vmax = v
-                imax = i
         # return None if tie
-        if len([v for i,v in self.vps.iteritems() if v == self.vps[imax]]) > 1:
+        if self.ntop > 1:
             return None
-        return [p for p in self.players if p.index == imax][0]
+        return self.players[self.leader]
 
     def validate(self):
         assert(len(set([p.index for p in self.players])) == len(self.players))
-        assert all([type(p.index) is int and p.index > 0 for p in self.players])
+        assert all([type(p.index) is int and 0 < p.index <= np.iinfo(np.int8).max for p in self.players])
 
 class Game:
-    def __init__(self, board, deck, max_nturns=200, vps_to_win=11, verbose=False):
+    def __init__(self, board, deck, max_nturns=200, vps_to_win=11, verbose=False, recorder=None, profiler=None, stop_stuck=True):
+        """
+        stop_stuck: end a game as MAX_ITERS as soon as its board provably
+            cannot be cleared before max_nturns (see is_stuck)
+        verbose: print every turn through an events.ConsoleListener
+        recorder: optional recorder.Recorder that logs every turn; added as a listener
+        profiler: optional profiler.Profiler; when None, play runs no profiling code
+        """
         self.board = board
         self.deck = deck
         self.max_nturns = max_nturns
@@ -66,18 +152,56 @@ class Game:
         self.valid_actions = ["draw", "buy"]
         self.valid_cards = ["garden", "curse"]
         self.verbose = verbose
+        self.profiler = profiler
+        self.stop_stuck = stop_stuck
+        self.ngardens = deck.card_info.get("garden", 0)
+        self.listeners = []
+        self.turn = 0
+        if verbose:
+            self.add_listener(ConsoleListener(board))
+        if recorder is not None:
+            self.add_listener(recorder)
         assert set(self.deck.card_names) == set(self.valid_cards)
 
     def play(self, players, print_end_status=True):
+        if self.profiler is None:
+            return self.play_turns(players, print_end_status)
+        self.profiler.attach(self, players)
+        try:
+            return self.play_turns(players, print_end_status)
+        finally:
+            self.profiler.detach()
+
+    def play_turns(self, players, print_end_status):
         Ps = Players(players)
+        for p in players:
+            p.start_game(self, Ps)
+        if self.listeners:
+            self.emit(GameStart(self.board, Ps))
+        nplayers = len(players)
         for i in xrange(self.max_nturns):
             if self.game_is_over():
                 return self.end_game(Ps, i, False, print_end_status)
-            p = players[i % len(Ps.players)]
+            if self.stop_stuck and self.is_stuck(i):
+                if print_end_status:
+                    print "Warning: Game stopped, the board cannot be cleared in the turns left."
+                return self.end_game(Ps, i, True, print_end_status, nturns=i)
+            p = players[i % nplayers]
+            self.turn = i
             self.next_turn(p, Ps)
         print "Warning: Game ended due to max iterations."
         return self.end_game(Ps, i, True, print_end_status)
 
+    def add_listener(self, listener):
+        """
+        listener: called with every events.Event of the following games
+        """
+        self.listeners.append(listener)
+
+    def emit(self, event):
+        for listener in self.listeners:
+            listener(event)
+
     def reset(self):
         self.deck.init_deck()
         self.board.init_board()
@@ -85,38 +209,62 @@ class Game:
     def next_turn(self, p, Ps):
         act_name, acts = p.take_action(self.board, Ps.get_money(p.index))
         assert act_name in self.valid_actions
-        card = None
         if act_name == "draw":
             card = self.deck.draw()
+            if self.listeners:
+                self.emit(Draw(self.turn, p, card))
             if card == "garden":
-                self.board.add_random_garden()
+                r, c, n = self.board.add_random_garden()
+                if self.listeners:
+                    self.emit(Garden(self.turn, p, r, c, n))
             elif card == "curse":
                 assert len(acts) == 3 # (i,j,n)
                 (i,j,n) = acts
                 cs, add_curse = self.board.curse_tile((i,j), n)
                 if add_curse:
-                    self.deck.discard.append("curse")
+                    self.deck.add_card("curse")
                 for pind in cs:
                     Ps.update_vps(pind, cs[pind])
                 Ps.update_money(p.index, int(n>1) + n)
+                if self.listeners:
+                    self.emit(Curse(self.turn, p, i, j, n, cs, add_curse))
         elif act_name == "buy":
             is_success = self.board.add_objects(acts, p.index)
             cost = sum([self.board.obj_cost[nm] for nm,pos in acts])
             Ps.update_money(p.index, -cost)
             Ps.update_purchases(p.index, acts)
             assert is_success
-        if self.verbose:
-            print self.board.tiles
-            print "P({0}): {1} {2}".format(p.name, act_name, card if card is not None else str(acts))
-            print Ps.player_status(p.index)
+            if self.listeners:
+                self.emit(Buy(self.turn, p, acts, cost))
 
     def game_is_over(self):
-        return self.board.tiles.sum() == 0
+        return self.board.ntrees == 0
 
-    def end_game(self, Ps, i, max_iters_reached=False, print_end_status=True,):
+    def is_stuck(self, i):
+        """
+        True if, at the start of turn i, the game can only end as MAX_ITERS
+        with the VPs it has now: every slot holds a hut, so no player can
+        score, and the board provably cannot be cleared before the last turn.
+        Money still grows with every curse, so it is reported as of turn i.
+        """
+        nturns_left = self.max_nturns - 1 - i # a clear on the last turn still ends as MAX_ITERS
+        ntiles = len(self.board.tree_inds)
+        if ntiles + self.ngardens*(ntiles+1) <= nturns_left: # the most cannot_clear can count
+            return False
+        if self.board.nhuts < self.board.adj.nslots: # a station, or a slot for one
+            return False
+        draw, discard = self.deck.counts()
+        return cannot_clear(ntiles, (draw["garden"], draw["curse"]), (discard["garden"], discard["curse"]), nturns_left)
+
+    def end_game(self, Ps, i, max_iters_reached=False, print_end_status=True, nturns=None):
+        # kept for per-game statistics
+        if nturns is None:
+            nturns = i+1 if max_iters_reached else i
+        self.nturns = nturns
+        self.final_players = Ps
         if print_end_status:
             print "Game ended after {0} turns, ".format(i+1),
-        score = '-'.join([str(v) for v in Ps.vps.values()])
+        score = '-'.join([str(v) for v in Ps.stats[VPS]])
         winner = None
         if self.game_is_win(Ps):
             status = "WIN"
@@ -134,69 +282,293 @@ class Game:
             if print_end_status:
                 print "Game LOST {0}.".format(score)
         if print_end_status:
-            for i,c in Ps.huts.iteritems():
-                print "    P{0}: {1} huts".format(i,c)
-            for i,c in Ps.stations.iteritems():
-                print "    P{0}: {1} stations".format(i,c)
+            for p,c in zip(Ps.players, Ps.stats[HUTS]):
+                print "    P{0}: {1} huts".format(p.index,c)
+            for p,c in zip(Ps.players, Ps.stats[STATIONS]):
+                print "    P{0}: {1} stations".format(p.index,c)
         if max_iters_reached:
             status = "MAX_ITERS"
+        if self.listeners:
+            self.emit(GameEnd(self.nturns, status, pi if winner is not None else None, Ps, Ps.stats[VPS].tolist()))
         return status, winner
 
     def game_is_win(self, Ps):
-        return sum(Ps.vps.values()) >= self.vps_to_win
+        return Ps.total_vps >= self.vps_to_win
+
+class Adjacency:
+    def __init__(self, nrows, ncols):
+        """
+        neighbors between tiles and grid slots for one board shape, as flat inds:
+            slot_tiles: (nslots, 3), the tiles touching each grid slot
+            tile_offsets, tile_slots: CSR rows of the grid slots touching each tile
+            tile_slots_padded: (ntiles, 6), tile_slots padded with nslots,
+                a sentinel slot that callers keep empty
+        plus the same neighbors as (row, col) lists for Board's per-tile lookups
+        """
+        self.nrows = nrows
+        self.ncols = ncols
+        self.grid_shape = (2*(nrows-1), ncols-1)
+        gr, gc = self.grid_shape
+        self.nslots = gr*gc
+
+        # ignoring edge object tiles, so every slot touches three tiles
+        self.grid_tiles = [[self.tiles_touching_grid(i,j) for j in xrange(gc)] for i in xrange(gr)]
+        self.slot_tiles = np.array([[r*ncols + c for r,c in inds] for row in self.grid_tiles for inds in row], dtype=int).reshape(self.nslots, 3)
+
+        self.tile_grids = [[self.grids_touching_tile(r,c) for c in xrange(ncols)] for r in xrange(nrows)]
+        counts = [len(inds) for row in self.tile_grids for inds in row]
+        self.tile_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(int)
+        self.tile_slots = np.array([i*gc + j for row in self.tile_grids for inds in row for i,j in inds], dtype=int)
+        self.tile_slots_padded = np.empty([nrows*ncols, 6], dtype=int)
+        self.tile_slots_padded.fill(self.nslots)
+        for t in xrange(nrows*ncols):
+            a, b = self.tile_offsets[t], self.tile_offsets[t+1]
+            self.tile_slots_padded[t, :b-a] = self.tile_slots[a:b]
+
+    def grids_touching_tile(self, r, c):
+        ro = 2*r
+        co = c
+        rs = [ro-2, ro-1, ro-1, ro,   ro, ro+1]
+        cs = [co,   co-1, co,   co-1, co, co-1]
+        inds = [(r,c) for r,c in zip(rs,cs) if 0 <= r < self.grid_shape[0] and 0 <= c < self.grid_shape[1]]
+        return inds
+
+    def tiles_touching_grid(self, r, c):
+        tr = r/2
+        tc = c
+        if r % 2 == 0:
+            inds = [(tr,tc), (tr,tc+1), (tr+1,tc)]
+        else:
+            inds = [(tr+1,tc+1), (tr,tc+1), (tr+1,tc)]
+        return inds
+
+    def slot_values(self, tiles):
+        # sparse (slot x tile) incidence times the tile vector
+        return tiles.ravel()[self.slot_tiles].sum(axis=1).reshape(self.grid_shape)
+
+_adjacency = {}
+def get_adjacency(nrows, ncols):
+    """
+    Adjacency is built once per board shape and shared between boards
+    """
+    if (nrows, ncols) not in _adjacency:
+        _adjacency[(nrows, ncols)] = Adjacency(nrows, ncols)
+    return _adjacency[(nrows, ncols)]
 
 class Board:
-    def __init__(self, (nrows, ncols), obj_cost, ntrees=15):
+    def __init__(self, (nrows, ncols), obj_cost, ntrees=15, rng=None):
         """
         costs = {name: cost, ...}
+        rng: np.random.RandomState; defaults to the global np.random
         """
         self.nrows = nrows
         self.ncols = ncols
         self.ntrees_init = ntrees
         self.obj_cost = obj_cost
+        self.rng = rng if rng is not None else np.random
         self.obj_add = {"hut": -1}
+        self.adj = get_adjacency(nrows, ncols)
         self.init_board()
 
     def init_board(self):
         self.tiles = self.init_tiles(self.nrows, self.ncols, self.ntrees_init)
         self.grid = self.init_grid(self.tiles)
+        self.init_tree_index()
+        self.init_slot_values()
 
     def get_tree_ind(self, tiles, n=1):
-        row = np.random.randint(low=0, high=tiles.shape[0], size=(n,))
-        col = np.random.randint(low=0, high=tiles.shape[1], size=(n,))
+        row = self.rng.randint(low=0, high=tiles.shape[0], size=(n,))
+        col = self.rng.randint(low=0, high=tiles.shape[1], size=(n,))
         return zip(row, col)
 
     def init_tiles(self, nrows, ncols, ntrees):
-        tiles = np.zeros([nrows, ncols])
-        trees = self.get_tree_ind(tiles, ntrees)
-        for (r,c) in trees:
-            tiles[r,c] += 1
+        tiles = np.zeros([nrows, ncols], dtype=np.int16)
+        # the same draws as get_tree_ind, added in one pass
+        row = self.rng.randint(low=0, high=nrows, size=(ntrees,))
+        col = self.rng.randint(low=0, high=ncols, size=(ntrees,))
+        np.add.at(tiles, (row, col), 1)
         return tiles
 
     def init_grid(self, tiles):
         # ignoring edge object tiles
         n_rows = 2*(tiles.shape[0]-1)
         n_cols = tiles.shape[1]-1
-        return np.zeros([n_rows,n_cols])
+        # 0 = empty, obj_add values for shared objects, else the owner's index
+        return np.zeros([n_rows,n_cols], dtype=np.int8)
 
     def grids_touching_tile(self, r, c):
-        ro = 2*r
-        co = c
-        rs = [ro-2, ro-1, ro-1, ro,   ro, ro+1]
-        cs = [co,   co-1, co,   co-1, co, co-1]
-        inds = [(r,c) for r,c in zip(rs,cs) if 0 <= r < self.grid.shape[0] and 0 <= c < self.grid.shape[1]]
-        return inds
+        return self.adj.tile_grids[r][c]
 
     def tiles_touching_grid(self, r, c):
-        # no boundary checks because we're ignoring edge object tiles
-        inds = []
-        tr = r/2
-        tc = c
-        if r % 2 == 0:
-            inds = [(tr,tc), (tr,tc+1), (tr+1,tc)]
-        else:
-            inds = [(tr+1,tc+1), (tr,tc+1), (tr+1,tc)]
-        return inds
+        return self.adj.grid_tiles[r][c]
+
+    def init_tree_index(self):
+        """
+        ntrees: total trees on the board
+        tree_inds: sorted flat inds of the tiles with trees
+        multi_inds: sorted flat inds of the tiles with more than one tree
+        """
+        self.ntrees = int(self.tiles.sum())
+        self.tree_inds = list(np.flatnonzero(self.tiles))
+        self.multi_inds = list(np.flatnonzero(self.tiles > 1))
+
+    def update_tree_index(self, r, c, delta):
+        t = r*self.ncols + c
+        n = self.tiles.item(r,c)
+        was = n - delta
+        self.ntrees += delta
+        if delta > 0 and was == 0:
+            bisect.insort(self.tree_inds, t)
+        elif delta < 0 and n == 0:
+            del self.tree_inds[bisect.bisect_left(self.tree_inds, t)]
+        if was < 2 <= n:
+            bisect.insort(self.multi_inds, t)
+        elif n < 2 <= was:
+            del self.multi_inds[bisect.bisect_left(self.multi_inds, t)]
+
+    def init_slot_values(self):
+        """
+        slot_vals: total trees touching every grid slot (flat), kept current
+            by update_slot_values whenever a tile changes
+        slot_heap: (-value, slot) max-heap over empty slots touching trees;
+            entries go stale when a slot's value changes or it gets filled,
+            and are dropped lazily
+        held: slot_heap entries of the slots reserved by the purchases in
+            progress, set aside until release_reserved
+        empty_cursor: no slot above it is empty; slots only fill between
+            restores, so it only moves down
+        nhuts: slots holding a hut, kept current by add_objects
+        """
+        self.slot_vals = self.adj.slot_values(self.tiles).ravel()
+        self.slot_heap = [(-self.slot_vals.item(i), i) for i in np.flatnonzero(self.slot_vals).tolist()]
+        heapq.heapify(self.slot_heap)
+        self.held = []
+        self.empty_cursor = self.adj.nslots - 1
+        self.nhuts = int((self.grid == self.obj_add["hut"]).sum())
+        self.init_owned()
+
+    def init_owned(self):
+        """
+        owned: (owners, nrows, ncols) count of every owner's slots touching
+            every tile, kept current by add_objects; owned_flat is the same
+            array as (owners, nrows*ncols). Both are views of the first rows
+            of owned_buf, which doubles when a new owner needs a row.
+        owners: the player index of every row of owned
+        owner_rows: {player index: row of owned}
+        owned_tiles: {player index: sorted flat inds of the tiles its slots touch}
+        """
+        grid = self.grid.ravel()
+        slots = np.flatnonzero(grid > 0)
+        self.owners = sorted(set(grid[slots].tolist()))
+        self.owner_rows = dict((p, k) for k,p in enumerate(self.owners))
+        self.set_owned_buf(np.zeros([max(2, len(self.owners)), self.nrows, self.ncols], dtype=np.int8))
+        rows = np.array([self.owner_rows[p] for p in grid[slots].tolist()], dtype=int)
+        np.add.at(self.owned_flat, (rows[:,None], self.adj.slot_tiles[slots]), 1)
+        self.owned_tiles = dict((p, np.flatnonzero(self.owned_flat[k])) for k,p in enumerate(self.owners))
+
+    def set_owned_buf(self, buf):
+        self.owned_buf = buf
+        self.owned = buf[:len(self.owners)]
+        self.owned_flat = self.owned.reshape(len(self.owners), self.nrows*self.ncols)
+
+    def update_slot_values(self, r, c, delta):
+        grid = self.grid.ravel()
+        t = r*self.ncols + c
+        for i in self.adj.tile_slots[self.adj.tile_offsets[t]:self.adj.tile_offsets[t+1]]:
+            self.slot_vals[i] += delta
+            if grid.item(i) == 0:
+                heapq.heappush(self.slot_heap, (-self.slot_vals[i], i))
+        if len(self.slot_heap) > 4*self.adj.nslots:
+            self.slot_heap = [(-self.slot_vals.item(i), i) for i in np.flatnonzero((self.slot_vals > 0) & (grid == 0)).tolist()]
+            heapq.heapify(self.slot_heap)
+
+    def most_valuable_empty_ind(self, exclude=()):
+        """
+        first (row-major) empty slot with the most trees touching it; if no
+        empty slot touches a tree, the last empty slot; None if none are empty
+        exclude: [(i,j), ...] slots to treat as filled: the purchases so far
+            this turn. Their heap entries stay in held across calls; an
+            empty exclude starts a new turn and releases them.
+        """
+        if not exclude and self.held:
+            self.release_reserved()
+        grid = self.grid.ravel()
+        ncols = self.grid.shape[1]
+        exclude = set([i*ncols + j for i,j in exclude])
+        heap = self.slot_heap
+        ind = None
+        while heap:
+            v, i = heap[0]
+            if grid.item(i) != 0 or self.slot_vals.item(i) != -v:
+                heapq.heappop(heap)
+            elif i in exclude:
+                self.held.append(heapq.heappop(heap))
+            else:
+                ind = i
+                break
+        if ind is None or self.slot_vals.item(ind) == 0:
+            ind = self.last_empty_ind(exclude)
+        if ind is None:
+            return None
+        return divmod(int(ind), ncols)
+
+    def last_empty_ind(self, exclude):
+        grid = self.grid.ravel()
+        k = self.empty_cursor
+        while k >= 0 and grid.item(k) != 0:
+            k -= 1
+        self.empty_cursor = k
+        while k >= 0 and (grid.item(k) != 0 or k in exclude):
+            k -= 1
+        return k if k >= 0 else None
+
+    def release_reserved(self):
+        # back onto slot_heap; the entries of slots bought meanwhile are dropped lazily
+        for e in self.held:
+            heapq.heappush(self.slot_heap, e)
+        self.held = []
+
+    def snapshot(self):
+        """
+        the board's mutable state, caches included, for restore
+        """
+        self.release_reserved()
+        owned = (self.owned.copy(), list(self.owners), dict(self.owned_tiles))
+        return (self.tiles.copy(), self.grid.copy(), self.ntrees, list(self.tree_inds), list(self.multi_inds), self.slot_vals.copy(), list(self.slot_heap), self.empty_cursor, self.nhuts, owned)
+
+    def restore(self, snap):
+        # copies, so a snapshot can be restored any number of times
+        # (owned_tiles arrays are replaced, never changed in place, so they are shared)
+        tiles, grid, self.ntrees, tree_inds, multi_inds, slot_vals, slot_heap, self.empty_cursor, self.nhuts, (owned, owners, owned_tiles) = snap
+        np.copyto(self.tiles, tiles)
+        np.copyto(self.grid, grid)
+        np.copyto(self.slot_vals, slot_vals)
+        self.tree_inds = list(tree_inds)
+        self.multi_inds = list(multi_inds)
+        self.owners = list(owners)
+        self.set_owned_buf(owned.copy())
+        self.owner_rows = dict((p, k) for k,p in enumerate(self.owners))
+        self.owned_tiles = dict(owned_tiles)
+        self.slot_heap = list(slot_heap)
+        self.held = []
+
+    def add_owned_slot(self, player_index, slot):
+        if player_index not in self.owner_rows:
+            self.owner_rows[player_index] = len(self.owners)
+            self.owners.append(player_index)
+            buf = self.owned_buf
+            if len(self.owners) > len(buf):
+                buf = np.zeros([max(2, 2*len(buf)), self.nrows, self.ncols], dtype=np.int8)
+                buf[:len(self.owned)] = self.owned
+            self.set_owned_buf(buf)
+            self.owned_tiles[player_index] = np.zeros(0, dtype=int)
+        owned = self.owned_flat[self.owner_rows[player_index]]
+        ts = self.adj.slot_tiles[slot]
+        owned[ts] += 1
+        new = ts[owned[ts] == 1]
+        if len(new):
+            # only the slot's own tiles can be new, so merge those in rather than rescan the row
+            self.owned_tiles[player_index] = np.union1d(self.owned_tiles[player_index], new)
 
     def add_objects(self, objs, player_index):
         is_success = all([nm in self.obj_cost for nm,pos in objs])
@@ -205,8 +577,10 @@ class Board:
             is_success = is_success and (self.grid[i,j] == 0)
             if nm in self.obj_add:
                 self.grid[i,j] = self.obj_add[nm]
+                self.nhuts += nm == "hut"
             else:
                 self.grid[i,j] = player_index # e.g. 1,2,...
+                self.add_owned_slot(player_index, i*self.grid.shape[1] + j)
         return is_success
 
     def valid_object_inds(self):
@@ -214,62 +588,174 @@ class Board:
         return [(i,j) for (i,j) in inds if self.grid[i,j] == 0]
 
     def valid_curse_inds(self):
-        return [(r,c, self.tiles[r,c]) for r in xrange(self.tiles.shape[0]) for c in xrange(self.tiles.shape[1]) if self.tiles[r,c] > 0]
+        inds = [divmod(int(t), self.ncols) for t in self.tree_inds]
+        return [(r,c, self.tiles.item(r,c)) for r,c in inds]
 
     def add_random_garden(self, hut_multiplier=2):
         ind = self.get_tree_ind(self.tiles, n=1)
         r,c = ind[0]
-        
+        return self.add_garden(int(r), int(c), hut_multiplier)
+
+    def add_garden(self, r, c, hut_multiplier=2):
+        """
+        returns (r, c, number of trees added)
+        """
         # check for hut nearby
         inds = self.grids_touching_tile(r,c)
-        v = len([1 for ro,co in inds if self.grid[ro,co] == self.obj_add["hut"]])
+        v = len([1 for ro,co in inds if self.grid.item(ro,co) == self.obj_add["hut"]])
         self.tiles[r,c] += (hut_multiplier*v+1)
+        self.update_tree_index(r, c, hut_multiplier*v+1)
+        self.update_slot_values(r, c, hut_multiplier*v+1)
+        return r, c, hut_multiplier*v+1
 
     def curse_tile(self, (r, c), n):
         assert n >= 1
-        assert self.tiles[r,c] >= n
+        n = int(n)
+        assert self.tiles.item(r,c) >= n
         self.tiles[r,c] -= n
+        self.update_tree_index(r, c, -n)
+        self.update_slot_values(r, c, -n)
 
         # check for VPs
-        cs = {} # counts of adjacent objects, per player
-        inds = self.grids_touching_tile(r,c)
-        for ro,co in inds:
-            if self.grid[ro,co] > 0:
-                pind = int(self.grid[ro,co])
-                if pind not in cs:
-                    cs[pind] = 0
-                cs[pind] += 1
+        counts = self.owned[:, r, c].tolist()
+        cs = dict((p, v) for p, v in zip(self.owners, counts) if v) # counts of adjacent objects, per player
 
         # 2nd val notifies if we need to add a curse
-        return cs, self.tiles[r,c] == 0
+        return cs, self.tiles.item(r,c) == 0
 
 class Deck:
-    def __init__(self, card_info):
+    def __init__(self, card_info, rng=None):
         """
         cards = [(name, count), ...]
+        rng: np.random.RandomState; defaults to the global np.random
         """
         self.card_info = card_info
         self.card_names = self.card_info.keys()
+        self.card_codes = dict((name, k) for k,name in enumerate(self.card_names))
+        self.rng = rng if rng is not None else np.random
         self.init_deck()
 
     def init_deck(self):
+        """
+        cards are stored as int8 codes into card_names; the draw pile is
+        deck[:ndeck] (top card last) and the discard pile is discard[:ndiscard]
+        """
         deck = []
         for (name, count) in self.card_info.iteritems():
-            deck.extend([name]*count)
-        np.random.shuffle(deck)
-        self.deck = deck
-        self.discard = []
+            deck.extend([self.card_codes[name]]*count)
+        self.deck = np.array(deck, dtype=np.int8)
+        self.rng.shuffle(self.deck)
+        self.ndeck = len(self.deck)
+        self.discard = np.zeros(len(self.deck), dtype=np.int8)
+        self.ndiscard = 0
 
     def draw(self):
-        if len(self.deck) == 0:
+        if self.ndeck == 0:
             self.shuffle()
-        card = self.deck.pop()
-        self.discard.append(card)
-        return card
+        self.ndeck -= 1
+        card = self.deck[self.ndeck]
+        self.discard_card(card)
+        return self.card_names[card]
+
+    def add_card(self, name):
+        # new cards go to the discard pile
+        self.discard_card(self.card_codes[name])
+
+    def discard_card(self, code):
+        if self.ndiscard == len(self.discard):
+            self.discard = np.concatenate([self.discard, np.zeros(max(1, len(self.discard)), dtype=np.int8)])
+        self.discard[self.ndiscard] = code
+        self.ndiscard += 1
+
+    def counts(self):
+        """
+        ({name: count}, {name: count}) of the draw and discard piles
+        """
+        draw = np.bincount(self.deck[:self.ndeck], minlength=len(self.card_names))
+        discard = np.bincount(self.discard[:self.ndiscard], minlength=len(self.card_names))
+        return dict(zip(self.card_names, draw.tolist())), dict(zip(self.card_names, discard.tolist()))
+
+    def snapshot(self):
+        return self.deck.copy(), self.ndeck, self.discard.copy(), self.ndiscard
+
+    def restore(self, snap):
+        deck, self.ndeck, discard, self.ndiscard = snap
+        self.deck = deck.copy()
+        self.discard = discard.copy()
+
+    def shuffle(self):
+        assert self.ndeck == 0
+        # the discard buffer becomes the draw pile, and vice versa
+        self.deck, self.discard = self.discard, self.deck
+        self.ndeck, self.ndiscard = self.ndiscard, 0
+        self.rng.shuffle(self.deck[:self.ndeck])
+        # print collections.Counter(self.card_names[c] for c in self.deck[:self.ndeck])
+
+class CountingDeck:
+    def __init__(self, card_info, rng=None):
+        """
+        Deck that only counts each card type in the draw and discard piles.
+        The draw pile is uniformly shuffled, so its top card is card k with
+        probability deck[k]/ndeck; drawing that way is equivalent in
+        distribution to Deck, but costs O(1) with no lists or shuffles.
+        cards = [(name, count), ...]
+        rng: np.random.RandomState; defaults to the global np.random
+        """
+        self.card_info = card_info
+        self.card_names = self.card_info.keys()
+        self.card_codes = dict((name, k) for k,name in enumerate(self.card_names))
+        self.rng = rng if rng is not None else np.random
+        self.init_deck()
+
+    def init_deck(self):
+        # card counts, indexed by card code
+        self.deck = [self.card_info[name] for name in self.card_names]
+        self.ndeck = sum(self.deck)
+        self.discard = [0]*len(self.card_names)
+        self.ndiscard = 0
+
+    def draw(self):
+        if self.ndeck == 0:
+            self.shuffle()
+        u = self.rng.randint(self.ndeck)
+        card = 0
+        while u >= self.deck[card]:
+            u -= self.deck[card]
+            card += 1
+        self.deck[card] -= 1
+        self.ndeck -= 1
+        self.discard_card(card)
+        return self.card_names[card]
+
+    def add_card(self, name):
+        # new cards go to the discard pile
+        self.discard_card(self.card_codes[name])
+
+    def discard_card(self, code):
+        self.discard[code] += 1
+        self.ndiscard += 1
+
+    def counts(self):
+        return dict(zip(self.card_names, self.deck)), dict(zip(self.card_names, self.discard))
+
+    def set_counts(self, draw, discard):
+        """
+        draw, discard: {name: count}, e.g. from another deck's counts()
+        """
+        self.deck = [draw.get(name, 0) for name in self.card_names]
+        self.discard = [discard.get(name, 0) for name in self.card_names]
+        self.ndeck = sum(self.deck)
+        self.ndiscard = sum(self.discard)
+
+    def snapshot(self):
+        return list(self.deck), self.ndeck, list(self.discard), self.ndiscard
+
+    def restore(self, snap):
+        deck, self.ndeck, discard, self.ndiscard = snap
+        self.deck = list(deck)
+        self.discard = list(discard)
 
     def shuffle(self):
-        assert len(self.deck) == 0
-        self.deck = [x for x in self.discard]
-        self.discard = []
-        np.random.shuffle(self.deck)
-        # print collections.Counter(self.deck)
+        assert self.ndeck == 0
+        self.deck, self.discard = self.discard, self.deck
+        self.ndeck, self.ndiscard = self.ndiscard, 0
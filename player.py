@@ -1,11 +1,56 @@
-import random
 import numpy as np
 
+# A strategy is a vector of PARAMS. Probabilities of 0 or 1 are plain
+# rules and never touch the rng; in between, the player draws from
+# board.rng, so interpolated strategies stay reproducible per game.
+PARAMS = [
+    "hut_first",         # P(the next object is a hut) with nothing bought yet,
+    "hut_after_hut",     #     after buying a hut,
+    "hut_after_station", #     and after buying a station
+    "wait_for_both",     # P(waiting when only that object is affordable, not both)
+    "substitute",        # P(buying the other object when that one is not affordable)
+    "bonus",             # P(cursing both trees of a 2-tree tile, for the extra $1)
+    "keep",              # trees to leave on a cursed tile; a fraction is a chance of one more
+]
+HUT_FIRST, HUT_AFTER_HUT, HUT_AFTER_STATION, WAIT_FOR_BOTH, SUBSTITUTE, BONUS, KEEP = range(len(PARAMS))
+OBJ_CODES = {"hut": 1, "station": 2} # last purchase; 0 = nothing bought yet
+
+PRESETS = {
+    "default":       [1, 0, 1, 1, 0, 0, 1],
+    "reasonable":    [1, 0, 1, 1, 0, 1, 1],
+    "selfish":       [0, 0, 0, 0, 0, 0, 1],
+    "super-selfish": [0, 0, 0, 0, 0, 1, 1],
+    "cautious":      [1, 0, 1, 0, 1, 0, 1],
+    "generous":      [1, 1, 1, 0, 0, 0, 1],
+}
+
+def interpolate(a, b, t):
+    """
+    the strategy t of the way from a to b (names in PRESETS or vectors)
+    """
+    a, b = [np.array(PRESETS[str(v)] if isinstance(v, basestring) else v, dtype=float) for v in [a, b]]
+    return ((1-t)*a + t*b).tolist()
+
 class DefaultPlayer:
-    def __init__(self, index, name=None):
+    params = PRESETS["default"]
+
+    def __init__(self, index, name=None, params=None):
+        """
+        params: a strategy vector (see PARAMS); defaults to the class's preset
+        """
         self.index = index # should be int > 0
         self.name = name if name is not None else str(self.index)
         self.purchases = []
+        if params is not None:
+            assert len(params) == len(PARAMS)
+            self.params = [float(v) for v in params]
+
+    def chance(self, board, p):
+        return p >= 1 or (p > 0 and board.rng.rand() < p)
+
+    def start_game(self, game, Ps):
+        # called by Game.play before the first turn
+        pass
 
     def take_action(self, board, cur_money):
         if any([cur_money >= v for v in board.obj_cost.values()]):
@@ -17,25 +62,29 @@ class DefaultPlayer:
             return "draw", self.choose_curse_tile(board)
 
     def choose_curse_amount(self, board, r, c):
-        return max(1, board.tiles[r,c]-1)        
+        nts = board.tiles.item(r,c)
+        if nts == 2 and self.chance(board, self.params[BONUS]):
+            return 2
+        keep = int(self.params[KEEP])
+        if self.chance(board, self.params[KEEP] - keep):
+            keep += 1
+        return max(1, nts - keep)
 
     def choose_curse_tile(self, board):
-        options = board.valid_curse_inds()
+        # only tiles touching our own slots can score, so skip the rest of the board
         max_score = 0
-        (r,c) = (0,0)
-        for rc,cc,nts in options:
-            inds = board.grids_touching_tile(rc,cc)
-            v = len([1 for ro,co in inds if self.index == board.grid[ro,co]])
-            if v > 0 and v*nts > max_score:
-                r = rc
-                c = cc
-                max_score = v*nts
+        ts = board.owned_tiles.get(self.index)
+        if ts is not None and len(ts):
+            scores = board.owned_flat[board.owner_rows[self.index]].take(ts).astype(int)*board.tiles.take(ts)
+            k = scores.argmax()
+            max_score = scores.item(k)
+            t = ts.item(k)
         if max_score == 0:
-            top_opts = [(r,c,nts) for r,c,nts in options if nts > 1]
-            if top_opts:
-                r,c,nts = random.choice(top_opts)
+            if board.multi_inds:
+                t = board.multi_inds[board.rng.randint(len(board.multi_inds))]
             else:
-                r,c,nts = random.choice(options)
+                t = board.tree_inds[board.rng.randint(len(board.tree_inds))]
+        r,c = divmod(int(t), board.ncols)
         n = self.choose_curse_amount(board, r,c)
         return r,c,n
 
@@ -43,28 +92,7 @@ class DefaultPlayer:
         """
         should also account for whether a tile already has a hut nearby
         """
-        vals = []
-        max_val = 0
-        max_ind = (0,0)
-        backup_ind = []
-        inds = board.valid_object_inds()
-        recent_inds = [pos for nm,pos in recent_acts]
-        for (i,j) in inds:
-            if (i,j) in recent_inds:
-                continue
-            inds_t = board.tiles_touching_grid(i,j)
-            v = np.sum([board.tiles[x,y] for (x,y) in inds_t])
-            vals.append((i,j,v))
-            if v > max_val:
-                max_ind = (i,j)
-                max_val = v
-            else:
-                backup_ind = (i,j)
-        if max_val == 0:
-            max_ind = backup_ind
-            if len(backup_ind) == 0:
-                return None
-        return max_ind
+        return board.most_valuable_empty_ind([pos for nm,pos in recent_acts])
 
     def choose_hut_pos(self, board, recent_acts):
         return self.get_most_valuable_empty_inds(board, recent_acts)
@@ -74,16 +102,18 @@ class DefaultPlayer:
 
     def buy_object(self, board, money, cost_of_hut, cost_of_log, recent_acts):
         assert money >= min(cost_of_hut, cost_of_log)
-        if money >= cost_of_log and money >= cost_of_hut:
-            if not self.purchases: # buy a hut first
-                name = "hut"
-            elif "hut" == self.purchases[-1][0]:
-                # if you bought a hut last, buy a station
-                name = "station"
-            else:
-                name = "hut"
+        last = OBJ_CODES[self.purchases[-1][0]] if self.purchases else 0
+        name = "hut" if self.chance(board, self.params[HUT_FIRST + last]) else "station"
+        can = {"hut": money >= cost_of_hut, "station": money >= cost_of_log}
+        if can["hut"] and can["station"]:
+            pass
+        elif can[name]:
+            if self.chance(board, self.params[WAIT_FOR_BOTH]):
+                return name, None
+        elif self.chance(board, self.params[SUBSTITUTE]):
+            name = "station" if name == "hut" else "hut"
         else: # wait til you can choose
-            return "hut", None
+            return name, None
 
         pos = self.choose_station_pos(board, recent_acts)
         return name, pos
@@ -96,70 +126,31 @@ class DefaultPlayer:
             name, pos = self.buy_object(board, cur_money, cost_of_hut, cost_of_log, objs)
             assert name in ["hut", "station"]
             if pos is None:
-                return objs
+                break
             objs.append((name, pos))
             if name == "hut":
                 cur_money -= cost_of_hut
             elif name == "station":
                 cur_money -= cost_of_log
             self.purchases.append((name, pos))
+        # objs reserved their slots on the board's heap until now
+        board.release_reserved()
         return objs
 
 class SelfishPlayer(DefaultPlayer):
-    def buy_object(self, board, money, cost_of_hut, cost_of_log, recent_acts):
-        assert money >= min(cost_of_hut, cost_of_log)
-        name = "station"
-        if money >= cost_of_log:
-            pos = self.choose_station_pos(board, recent_acts)
-        else:
-            # give up; wait another turn
-            pos = None
-        return name, pos
+    params = PRESETS["selfish"]
 
 class SuperSelfishPlayer(SelfishPlayer):
-    def choose_curse_amount(self, board, r, c):
-        if board.tiles[r,c] == 2:
-            # always choose the bonus
-            return 2
-        else:
-            return max(1, board.tiles[r,c]-1)
+    params = PRESETS["super-selfish"]
 
 class ReasonablePlayer(DefaultPlayer):
-    def choose_curse_amount(self, board, r, c):
-        if board.tiles[r,c] == 2:
-            # always choose the bonus
-            return 2
-        else:
-            return max(1, board.tiles[r,c]-1)
+    params = PRESETS["reasonable"]
 
 class CautiousPlayer(DefaultPlayer):
-    def buy_object(self, board, money, cost_of_hut, cost_of_log, recent_acts):
-        assert money >= min(cost_of_hut, cost_of_log)
-        if money >= cost_of_log and money >= cost_of_hut:
-            if not self.purchases: # buy a hut first
-                name = "hut"
-            elif "hut" == self.purchases[-1][0]:
-                # if you bought a hut last, buy a station
-                name = "station"
-            else:
-                name = "hut"
-        elif money >= cost_of_log:
-            # if you can only buy a station, buy a station
-            name = "station"
-        elif money >= cost_of_hut:
-            # if you can only buy a hut, buy a hut
-            name = "hut"
-
-        pos = self.choose_station_pos(board, recent_acts)
-        return name, pos
+    params = PRESETS["cautious"]
 
 class GenerousPlayer(DefaultPlayer):
-    def buy_object(self, board, money, cost_of_hut, cost_of_log, recent_acts):
-        assert money >= min(cost_of_hut, cost_of_log)
-        name = "hut"
-        if money >= cost_of_hut:
-            pos = self.choose_station_pos(board, recent_acts)
-        else:
-            # give up; wait another turn
-            pos = None
-        return name, pos
+    params = PRESETS["generous"]
+
+# one player per distinct way of buying objects
+BUY_POLICIES = [DefaultPlayer, SelfishPlayer, CautiousPlayer, GenerousPlayer]
@@ -0,0 +1,147 @@
+"""
+Per-phase timers for Game.next_turn.
+
+Profiler.attach wraps the methods named in PHASES on the game's own
+board, deck and player instances, so a Game built without a profiler
+runs exactly the unwrapped code; Game.play detaches it when the game
+ends, so reused players go back to their own methods. Every sampled call is charged to
+(player type of the current turn, phase); times are inclusive, e.g.
+take_action includes the choose_curse_tile or buy_objects it calls.
+"""
+import collections
+import json
+import timeit
+import numpy as np
+
+clock = timeit.default_timer
+
+# (attribute of the game holding the object, or None for the game itself, methods)
+PHASES = [
+    (None, ["next_turn"]),
+    ("board", ["curse_tile", "add_random_garden", "add_objects"]),
+    ("deck", ["draw", "add_card"]),
+]
+PLAYER_PHASES = ["take_action", "choose_curse_tile", "buy_objects"]
+
+class Profiler:
+    def __init__(self, sample=1.0, seed=0, trace=False, max_events=1000000):
+        """
+        sample: share of turns to time; the others run through the
+            wrappers with a single flag check
+        trace: keep every timed call for to_chrome_trace, up to max_events
+        """
+        self.sample = sample
+        self.rng = np.random.RandomState(seed)
+        self.trace = trace
+        self.max_events = max_events
+        self.calls = collections.Counter()
+        self.total = collections.Counter()
+        self.max = collections.Counter()
+        self.events = []
+        self.nturns = 0
+        self.active = False
+        self.ptype = None
+        self.t0 = clock()
+        self.wrapped = [] # (object, method name) of the wrappers attached
+
+    def attach(self, game, players):
+        for attr, names in PHASES:
+            obj = game if attr is None else getattr(game, attr)
+            for name in names:
+                self.wrap(obj, name, None)
+        for p in players:
+            for name in PLAYER_PHASES:
+                if hasattr(p, name):
+                    self.wrap(p, name, p.__class__.__name__)
+
+    def detach(self):
+        # drops the instance attributes, uncovering the class's methods
+        for obj, name in self.wrapped:
+            if getattr(obj.__dict__.get(name), "profiler", None) is self:
+                delattr(obj, name)
+        self.wrapped = []
+
+    def wrap(self, obj, name, ptype):
+        f = obj.__dict__.get(name)
+        if getattr(f, "profiler", None) is self:
+            return
+        if hasattr(f, "profiler"):
+            # still wrapped for another profiler: time the method itself, not its wrapper
+            delattr(obj, name)
+        f = getattr(obj, name)
+        if name == "next_turn":
+            def wrapped(p, Ps):
+                self.nturns += 1
+                self.active = self.sample >= 1 or self.rng.rand() < self.sample
+                self.ptype = p.__class__.__name__
+                return self.timed(f, name, self.ptype, (p, Ps))
+        else:
+            def wrapped(*args):
+                return self.timed(f, name, ptype or self.ptype, args)
+        wrapped.profiler = self
+        setattr(obj, name, wrapped)
+        self.wrapped.append((obj, name))
+
+    def timed(self, f, name, ptype, args):
+        if not self.active:
+            return f(*args)
+        t = clock()
+        out = f(*args)
+        dt = clock() - t
+        key = (ptype, name)
+        self.calls[key] += 1
+        self.total[key] += dt
+        if dt > self.max[key]:
+            self.max[key] = dt
+        if self.trace and len(self.events) < self.max_events:
+            self.events.append((name, ptype, t - self.t0, dt))
+        return out
+
+    def summary(self, by_player_type=True):
+        """
+        [(phase, player type or "all", calls, total s, mean us, max us, share of turn time), ...]
+        sorted by total time
+        """
+        calls = collections.Counter()
+        total = collections.Counter()
+        mx = collections.Counter()
+        for (ptype, name), c in self.calls.iteritems():
+            key = (name, ptype if by_player_type else "all")
+            calls[key] += c
+            total[key] += self.total[(ptype, name)]
+            mx[key] = max(mx[key], self.max[(ptype, name)])
+        turn_time = sum([t for (name, ptype), t in total.iteritems() if name == "next_turn"])
+        rows = []
+        for key in sorted(total, key=lambda k: -total[k]):
+            rows.append(key + (calls[key], total[key], 1e6*total[key]/calls[key], 1e6*mx[key], total[key]/max(turn_time, 1e-12)))
+        return rows
+
+    def print_summary(self, by_player_type=True):
+        print "{0} turns, {1} sampled".format(self.nturns, sum([c for (ptype, name), c in self.calls.iteritems() if name == "next_turn"]))
+        print "{0:<20}{1:<22}{2:>10}{3:>10}{4:>10}{5:>10}{6:>8}".format("phase", "player type", "calls", "total s", "mean us", "max us", "share")
+        for row in self.summary(by_player_type):
+            print "{0:<20}{1:<22}{2:>10}{3:>10.3f}{4:>10.1f}{5:>10.1f}{6:>8.3f}".format(*row)
+
+    def to_chrome_trace(self, fn):
+        """
+        writes the traced calls as complete ("X") events, one thread per
+        player type, for chrome://tracing or Perfetto
+        """
+        tids = dict((ptype, k) for k, ptype in enumerate(sorted(set([e[1] for e in self.events]))))
+        events = [{"name": name, "cat": ptype, "ph": "X", "ts": 1e6*t, "dur": 1e6*dt, "pid": 0, "tid": tids[ptype]} for name, ptype, t, dt in self.events]
+        events += [{"name": "thread_name", "ph": "M", "pid": 0, "tid": tid, "args": {"name": ptype}} for ptype, tid in tids.iteritems()]
+        with open(fn, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+if __name__ == '__main__':
+    from game import make_game, get_players, PLAYER_TYPES
+    prof = Profiler(sample=0.5, trace=True, max_events=20000)
+    ptypes = sorted(PLAYER_TYPES)
+    for i in xrange(300):
+        g = make_game(rng=np.random.RandomState([0, i]))
+        g.profiler = prof
+        g.play(get_players([ptypes[i % len(ptypes)], ptypes[(i/len(ptypes)) % len(ptypes)]]), print_end_status=False)
+    prof.print_summary()
+    print
+    prof.print_summary(by_player_type=False)
+    prof.to_chrome_trace("profile_trace.json")
@@ -0,0 +1,191 @@
+"""
+Compact binary game logs.
+
+A log file is one HEADER followed by fixed-width RECORDs, so the records
+can be memory-mapped and scanned as one array. Each game is a run of
+records: START, one TREE per initial non-empty tile, one record per turn
+event (GARDEN, CURSE, or one HUT/STATION per object bought), then END.
+Games are numbered from the header's seed convention: game g of a run
+started with seed s used RandomState(runner.game_seed(s, g)).
+"""
+import numpy as np
+from model import Board, Players, MONEY_SCALE
+from player import DefaultPlayer
+from batch import STATUS_NAMES
+from events import GameStart, TurnEvent, Garden, Curse, Buy, GameEnd
+
+MAGIC = "TOTC"
+VERSION = 1
+MAX_PLAYERS = 64
+
+HEADER = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u2"),
+    ("nrows", "<u2"),
+    ("ncols", "<u2"),
+    ("nplayers", "<u2"),
+    ("cost_of_hut", "<i4"), # in 1/MONEY_SCALE units
+    ("cost_of_station", "<i4"),
+    ("seed", "<i8"), # -1 if unknown
+    ("player_index", "i1", (MAX_PLAYERS,)),
+])
+
+RECORD = np.dtype([
+    ("game", "<i4"),
+    ("turn", "<i2"),
+    ("player", "i1"), # player index; the winner's (or -1) for END
+    ("kind", "i1"),
+    ("r", "<i2"),
+    ("c", "<i2"),
+    ("n", "<i4"), # trees added/removed; the status code for END
+])
+
+START, TREE, GARDEN, CURSE, HUT, STATION, END = range(7)
+
+class Recorder:
+    def __init__(self, fn, board, players, seed=-1, flush_every=4096):
+        """
+        board, players: the board and seating every recorded game uses
+        seed: the run's master seed, stored in the header
+        """
+        assert len(players) <= MAX_PLAYERS
+        header = np.zeros(1, dtype=HEADER)
+        header["magic"] = MAGIC
+        header["version"] = VERSION
+        header["nrows"] = board.nrows
+        header["ncols"] = board.ncols
+        header["nplayers"] = len(players)
+        header["cost_of_hut"] = int(round(board.obj_cost["hut"]*MONEY_SCALE))
+        header["cost_of_station"] = int(round(board.obj_cost["station"]*MONEY_SCALE))
+        header["seed"] = seed
+        header["player_index"][0, :len(players)] = [p.index for p in players]
+        self.f = open(fn, "wb")
+        header.tofile(self.f)
+        self.flush_every = flush_every
+        self.buffer = []
+        self.game_id = 0 # of the next game; callers may set it to match their seeds
+        self.turn = 0
+
+    def add(self, player, kind, r=0, c=0, n=0):
+        self.buffer.append((self.game_id, self.turn, player, kind, r, c, n))
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        np.array(self.buffer, dtype=RECORD).tofile(self.f)
+        self.buffer = []
+        self.f.flush()
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+    def __call__(self, event):
+        # a model.Game listener
+        if isinstance(event, TurnEvent):
+            self.turn = event.turn
+        if isinstance(event, GameStart):
+            self.start_game(event.board)
+        elif isinstance(event, Garden):
+            self.add(event.player.index, GARDEN, event.r, event.c, event.n)
+        elif isinstance(event, Curse):
+            self.add(event.player.index, CURSE, event.r, event.c, event.n)
+        elif isinstance(event, Buy):
+            for nm, (i,j) in event.acts:
+                self.add(event.player.index, HUT if nm == "hut" else STATION, i, j)
+        elif isinstance(event, GameEnd):
+            self.end_game(event.turn, event.status, event.winner.index if event.winner is not None else -1)
+
+    def start_game(self, board):
+        self.turn = 0
+        self.add(-1, START)
+        for t in board.tree_inds:
+            r, c = divmod(int(t), board.ncols)
+            self.add(-1, TREE, r, c, board.tiles.item(r,c))
+
+    def end_game(self, nturns, status, winner_index):
+        self.turn = nturns
+        self.add(winner_index, END, n=STATUS_NAMES.index(status))
+        self.game_id += 1
+
+class GameLog:
+    def __init__(self, fn):
+        """
+        records: the memory-mapped RECORD array of every game in the file
+        """
+        self.header = np.fromfile(fn, dtype=HEADER, count=1)[0]
+        assert self.header["magic"] == MAGIC and self.header["version"] == VERSION
+        self.records = np.memmap(fn, dtype=RECORD, mode="r", offset=HEADER.itemsize)
+        self.starts = np.flatnonzero(self.records["kind"] == START)
+        self.ends = np.flatnonzero(self.records["kind"] == END)
+
+    def games(self):
+        return self.records["game"][self.starts]
+
+    def game_records(self, k):
+        """
+        records of the k-th game in the file
+        """
+        return self.records[self.starts[k]:self.ends[k]+1]
+
+    def outcomes(self):
+        """
+        (status names, winner indices, turns) of every game, read from END records
+        """
+        ends = self.records[self.ends]
+        return [STATUS_NAMES[s] for s in ends["n"]], ends["player"], ends["turn"]
+
+    def replay(self, k, turn=None):
+        """
+        rebuilds (Board, Players) of the k-th game in the file after `turn`
+        turns (default: the end of the game) from the log alone
+        """
+        h = self.header
+        board = Board((int(h["nrows"]), int(h["ncols"])), {"hut": h["cost_of_hut"]/float(MONEY_SCALE), "station": h["cost_of_station"]/float(MONEY_SCALE)}, ntrees=0)
+        Ps = Players([DefaultPlayer(int(i)) for i in h["player_index"][:h["nplayers"]]])
+        recs = self.game_records(k)
+        for rec in recs[recs["kind"] == TREE]:
+            board.tiles[rec["r"], rec["c"]] = rec["n"]
+        board.init_tree_index()
+        board.init_slot_values()
+
+        if turn is not None:
+            recs = recs[recs["turn"] < turn]
+        for rec in recs:
+            kind, p, r, c, n = int(rec["kind"]), int(rec["player"]), int(rec["r"]), int(rec["c"]), int(rec["n"])
+            if kind == GARDEN:
+                assert board.add_garden(r, c)[2] == n
+            elif kind == CURSE:
+                cs, add_curse = board.curse_tile((r,c), n)
+                for pind in cs:
+                    Ps.update_vps(pind, cs[pind])
+                Ps.update_money(p, int(n>1) + n)
+            elif kind in (HUT, STATION):
+                acts = [("hut" if kind == HUT else "station", (r,c))]
+                assert board.add_objects(acts, p)
+                Ps.update_money(p, -board.obj_cost[acts[0][0]])
+                Ps.update_purchases(p, acts)
+        return board, Ps
+
+if __name__ == '__main__':
+    import time
+    from game import make_game, get_players
+    from runner import game_seed
+    fn = "games.totc"
+    g = make_game()
+    ps = get_players(["selfish", "reasonable"])
+    rec = Recorder(fn, g.board, ps, seed=0)
+    t = time.time()
+    for i in xrange(1000):
+        g = make_game(rng=np.random.RandomState(game_seed(0, i)))
+        g.add_listener(rec)
+        g.play(get_players(["selfish", "reasonable"]), print_end_status=False)
+    rec.close()
+    print "recorded in {0:.2f}s".format(time.time() - t)
+
+    log = GameLog(fn)
+    statuses, winners, turns = log.outcomes()
+    print "{0} games, {1} records, mean turns {2:.1f}".format(len(log.starts), len(log.records), turns.mean())
+    board, Ps = log.replay(0)
+    print board.tiles
+    print [Ps.player_status(p.index) for p in Ps.players]
@@ -0,0 +1,142 @@
+"""
+Shards games across a process pool. Game i is seeded with
+RandomState([seed, i]) and plays with fresh players, so the merged
+results depend only on (seed, ngames), not on how games are sharded.
+"""
+import collections
+import multiprocessing
+import numpy as np
+from game import get_players, make_game
+from model import VPS, MONEY, HUTS, STATIONS, MONEY_SCALE
+from batch import BatchGame, STATUS_NAMES
+from stats import wilson_interval, GameStats
+
+def game_seed(seed, i):
+    return [seed, i]
+
+def play_results(player_types, seed, start, stop, use_batch=False, config=None, stats=None, rows=None):
+    """
+    plays games [start, stop) of a run; returns [(status, winner), ...]
+    config: overrides for game.GAME_CONFIG
+    stats: optional stats.GameStats fed with every game
+    rows: optional list extended with every game's
+        (status code, winner seat or -1, nturns, vps, money, huts, stations)
+    """
+    seeds = [game_seed(seed, i) for i in xrange(start, stop)]
+    if use_batch:
+        g = make_game(config=config)
+        results = BatchGame(g.board, g.deck, g.max_nturns, g.vps_to_win).play(get_players(player_types), seeds, stats=stats, rows=rows)
+    else:
+        results = []
+        for s in seeds:
+            g = make_game(rng=np.random.RandomState(s), config=config)
+            ps = get_players(player_types)
+            status, winner = g.play(ps, print_end_status=False)
+            results.append((status, winner))
+            Ps = g.final_players
+            if stats is not None:
+                stats.update(g.nturns, Ps.stats[VPS], Ps.stats[MONEY]/float(MONEY_SCALE), status == "MAX_ITERS")
+            if rows is not None:
+                seat = [p.name for p in ps].index(winner) if winner is not None else -1
+                rows.append((STATUS_NAMES.index(status), seat, g.nturns, Ps.stats[VPS], Ps.stats[MONEY], Ps.stats[HUTS], Ps.stats[STATIONS]))
+    return results
+
+def play_outcomes(args):
+    """
+    returns counts of each (status, winner) for games [start, stop) of a run
+    """
+    return collections.Counter(play_results(*args))
+
+def play_games(args):
+    """
+    returns (winner counts, status counts, GameStats) for games [start, stop) of a run
+    """
+    player_types, seed, start, stop, use_batch = args
+    gs = GameStats(len(player_types), make_game().max_nturns)
+    results = play_results(player_types, seed, start, stop, use_batch, stats=gs)
+    ws = collections.Counter([w for st,w in results])
+    ss = collections.Counter([st for st,w in results])
+    return ws, ss, gs
+
+SHARD_SIZE = 250 # games per default work unit
+
+def shards(ngames, nshards):
+    bounds = np.linspace(0, ngames, nshards+1).astype(int)
+    return [(a, b) for a,b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+def play_game_parallel(player_types, ngames=100, seed=0, nworkers=None, nshards=None, use_batch=False):
+    """
+    nworkers: pool size (defaults to the cpu count)
+    nshards: number of work units (default: one per SHARD_SIZE games). The
+        GameStats quantile sketches depend on the shard boundaries, so the
+        default leaves them out of nworkers: a seed gives the same summary
+        on any machine.
+    """
+    nworkers = nworkers if nworkers is not None else multiprocessing.cpu_count()
+    nshards = nshards if nshards is not None else -(-ngames/SHARD_SIZE)
+    args = [(player_types, seed, a, b, use_batch) for a,b in shards(ngames, nshards)]
+    pool = multiprocessing.Pool(nworkers)
+    try:
+        results = pool.map(play_games, args)
+    finally:
+        pool.close()
+        pool.join()
+
+    ws = collections.Counter()
+    ss = collections.Counter()
+    gs = results[0][2]
+    for w, s, g in results:
+        ws.update(w)
+        ss.update(s)
+        if g is not gs:
+            gs.merge(g)
+    print '=================='
+    print ws
+    print ss
+    gs.print_summary()
+    return ws, ss, gs
+
+def play_game_adaptive(player_types, ci_width=0.05, max_games=100000, batch_size=500, seed=0, nworkers=1, use_batch=False):
+    """
+    plays batches of games until the 95% interval on the share of every
+    outcome (each player's WIN, TIE, LOSS, MAX_ITERS) is narrower than
+    ci_width, or max_games have been played. Games are seeded as in
+    play_game_parallel, so the first n games are the same in both.
+    returns (winner counts, status counts, games played)
+    """
+    assert max_games > 0
+    names = [p.name for p in get_players(player_types)]
+    outcomes = collections.Counter()
+    ngames = 0
+    pool = multiprocessing.Pool(nworkers) if nworkers > 1 else None
+    try:
+        while ngames < max_games:
+            n = min(batch_size, max_games - ngames)
+            args = [(player_types, seed, ngames + a, ngames + b, use_batch) for a,b in shards(n, nworkers)]
+            for out in (pool.map if pool else map)(play_outcomes, args):
+                outcomes.update(out)
+            ngames += n
+
+            counts = [sum([c for (st, w), c in outcomes.iteritems() if st == "WIN" and w == nm]) for nm in names]
+            counts += [sum([c for (st, w), c in outcomes.iteritems() if st == s]) for s in ["TIE", "LOSS", "MAX_ITERS"]]
+            lo, hi = wilson_interval(counts, ngames)
+            if (hi - lo).max() < ci_width:
+                break
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    ws = collections.Counter()
+    ss = collections.Counter()
+    for (st, w), c in outcomes.iteritems():
+        ws[w] += c
+        ss[st] += c
+    print '=================='
+    print ws
+    print ss
+    print "Stopped after {0} games (widest 95% interval: {1:.3f})".format(ngames, (hi - lo).max())
+    return ws, ss, ngames
+
+if __name__ == '__main__':
+    play_game_parallel(["reasonable", "reasonable"], ngames=1000)
@@ -7,6 +7,7 @@
 
 import random
 import numpy as np
+from stats import GameStats
 
 
 # In[400]:
@@ -265,11 +266,10 @@ cost_of_hut = 2
 cost_of_log = 3
 
 n_games = 1000
-nplays = []
 max_nplays = 200
 is_verbose = n_games <= 2
-all_vps = []
-all_maxms = []
+# streaming summaries, so memory stays flat in n_games
+stats = GameStats(2, max_nplays)
 
 for i in xrange(n_games):
     if is_verbose:
@@ -309,36 +309,22 @@ for i in xrange(n_games):
             print '--------------'    
     if is_verbose:
         print "Game ended after {0} plays and {1} VPs".format(c, vps)
-    nplays.append(c)
-    all_vps.append(vps)
-    all_maxms.append(max_moneys)
+    stats.update(c, vps, max_moneys)
     if is_verbose:
         print '================'
 
-print "Play counts: {0}".format(np.percentile(nplays, [0, 10, 50, 90, 100]))
-
-print "Max money P0: {0}".format(np.percentile(np.array(all_maxms)[:,0], [0, 10, 50, 90, 100]))
-print "Max money P1: {0}".format(np.percentile(np.array(all_maxms)[:,1], [0, 10, 50, 90, 100]))
-
-print "VPs total: {0}".format(np.percentile(np.array(all_vps).sum(axis=1), [0, 10, 50, 90, 100]))
-print "VPs P0: {0}".format(np.percentile(np.array(all_vps)[:,0], [0, 10, 50, 90, 100]))
-print "VPs P1: {0}".format(np.percentile(np.array(all_vps)[:,1], [0, 10, 50, 90, 100]))
-print "mean VPs: {0}".format(np.mean(all_vps, axis=0))
-
-print "corrs total={0}, P0={1}, P1={2}".format(np.corrcoef(nplays, np.array(all_vps).sum(axis=1))[0,1], np.corrcoef(nplays, np.array(all_vps)[:,0])[0,1], np.corrcoef(nplays, np.array(all_vps)[:,1])[0,1])
-
-print "{0} games did not complete".format(len([x for x in nplays if x == max_nplays]))
+stats.print_summary(money_name="Max money")
 
 
 
 # In[441]:
 
-np.sort(all_maxms, axis=0)[:,0]
+stats.money[0].quantiles(np.linspace(0, 1, 11))
 
 
 # In[422]:
 
-np.array(all_vps).sum(axis=1)
+stats.vps_total.quantiles(np.linspace(0, 1, 11))
 
 
 # In[ ]:
@@ -0,0 +1,78 @@
+"""
+Shared-memory result sink for pool workers.
+
+ResultSink preallocates one row per game (store.row_dtype) in a
+sharedctypes.RawArray before the pool forks. Each work unit owns the
+rows of its games [start, stop) and writes them in place, so workers
+send back only their range and the parent never unpickles per-game
+results. The parent reads the rows through np.frombuffer views over the
+same memory.
+"""
+import multiprocessing
+import multiprocessing.sharedctypes
+import numpy as np
+from runner import play_results, shards
+from store import row_dtype, to_rows, print_summary
+
+class ResultSink:
+    def __init__(self, ngames, nplayers):
+        self.ngames = ngames
+        self.nplayers = nplayers
+        self.dtype = row_dtype(nplayers)
+        self.raw = multiprocessing.sharedctypes.RawArray("c", ngames*self.dtype.itemsize)
+        self.rows = np.frombuffer(self.raw, dtype=self.dtype)
+        self.rows["status"] = -1
+
+    def write(self, start, rows):
+        """
+        rows: as filled in by runner.play_results, for games start, start+1, ...
+        """
+        self.rows[start:start + len(rows)] = to_rows(rows, start, self.nplayers)
+
+    def done(self):
+        return self.rows["status"] >= 0
+
+# set in each worker by the pool initializer; a RawArray can only be
+# handed to a process when it starts, not through pool.map
+_sink = None
+
+def init_worker(sink):
+    global _sink
+    _sink = sink
+
+def play_into_sink(args):
+    player_types, seed, start, stop, use_batch, config = args
+    rows = []
+    play_results(player_types, seed, start, stop, use_batch, config, rows=rows)
+    _sink.write(start, rows)
+    return start, stop
+
+def play_shared(player_types, ngames, seed=0, config=None, use_batch=True, nworkers=None, nshards=None):
+    """
+    plays games [0, ngames) of a run (seeded as in runner) into a
+    ResultSink; returns the sink
+    """
+    nworkers = nworkers if nworkers is not None else multiprocessing.cpu_count()
+    nshards = nshards if nshards is not None else 4*nworkers
+    sink = ResultSink(ngames, len(player_types))
+    args = [(player_types, seed, a, b, use_batch, config) for a, b in shards(ngames, nshards)]
+    if nworkers > 1:
+        pool = multiprocessing.Pool(nworkers, init_worker, (sink,))
+        try:
+            for out in pool.imap_unordered(play_into_sink, args):
+                pass
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        init_worker(sink)
+        map(play_into_sink, args)
+    return sink
+
+if __name__ == '__main__':
+    import time
+    for ngames in [10000, 40000]:
+        t0 = time.time()
+        sink = play_shared(["selfish", "generous"], ngames, nworkers=2)
+        print "{0} games in {1:.1f}s, all written: {2}".format(ngames, time.time() - t0, sink.done().all())
+        print_summary(sink.rows)
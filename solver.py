@@ -0,0 +1,379 @@
+"""
+Exact expectimax over small games.
+
+A state is (tiles, grid, money, vps, last, deck, turn): the board as flat
+tuples, money (in 1/MONEY_SCALE units), VPs and each seat's last
+purchase (only tracked for heuristic seats), the deck as (garden, curse)
+counts of the draw and discard piles (the draw pile is uniformly
+shuffled, so only its counts matter), and the turn. Chance nodes are the
+card drawn and the garden's tile. Each seat is played by a policy:
+"max"/"min" pick the action that maximizes/minimizes the win probability
+of seat me, and a player class plays exactly as in Game, with its random
+tie-breaks and the chances of its fractional parameters enumerated.
+
+Values are cached in a transposition table of bounded size. If no seat
+is a heuristic, states are first mapped to a canonical image under the
+board's symmetries; heuristics break ties by position, so their games
+are not symmetric.
+"""
+import collections
+import itertools
+import operator
+import sys
+import numpy as np
+from model import Board, get_adjacency, MONEY_SCALE
+from game import get_config, PLAYER_TYPES
+from player import BUY_POLICIES, OBJ_CODES
+
+HUT_VAL = -1 # Board.obj_add["hut"]
+HUT_MULTIPLIER = 2 # Board.add_random_garden's default
+
+class TranspositionTable:
+    def __init__(self, max_entries=1000000):
+        """
+        two generations of at most max_entries/2 each; when the new one
+        fills up, the old one is dropped, so entries not used since the
+        last turnover get evicted first
+        """
+        self.max_entries = max_entries
+        self.new = {}
+        self.old = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        v = self.new.get(key)
+        if v is None:
+            v = self.old.get(key)
+            if v is None:
+                self.misses += 1
+                return None
+            self.put(key, v)
+        self.hits += 1
+        return v
+
+    def put(self, key, v):
+        if len(self.new) >= self.max_entries/2:
+            self.evictions += len(self.old)
+            self.old = self.new
+            self.new = {}
+        self.new[key] = v
+
+    def __len__(self):
+        return len(self.new) + len(self.old)
+
+def board_symmetries(nrows, ncols):
+    """
+    [(tile permutation, slot permutation), ...] of the flips/rotations of
+    the tile array that map the tile-slot adjacency onto itself
+    """
+    adj = get_adjacency(nrows, ncols)
+    maps = [lambda r, c: (r, c), lambda r, c: (nrows-1-r, ncols-1-c),
+        lambda r, c: (r, ncols-1-c), lambda r, c: (nrows-1-r, c)]
+    if nrows == ncols:
+        maps += [lambda r, c: (c, r), lambda r, c: (ncols-1-c, nrows-1-r),
+            lambda r, c: (c, nrows-1-r), lambda r, c: (ncols-1-c, r)]
+    slots = dict((frozenset(ts), i) for i, ts in enumerate(adj.slot_tiles.tolist()))
+    syms = []
+    for f in maps:
+        tperm = [0]*(nrows*ncols)
+        for r in xrange(nrows):
+            for c in xrange(ncols):
+                r2, c2 = f(r, c)
+                tperm[r2*ncols + c2] = r*ncols + c # new tile t2 takes old tile t
+        inv = dict((t, t2) for t2, t in enumerate(tperm))
+        images = [frozenset([inv[t] for t in ts]) for ts in adj.slot_tiles.tolist()]
+        if all([im in slots for im in images]):
+            sperm = [0]*adj.nslots
+            for i, im in enumerate(images):
+                sperm[slots[im]] = i
+            syms.append((tperm, sperm))
+    return syms
+
+class ForcedRng:
+    # stands in for board.rng (and a heuristic's chance) so its random
+    # choices can be enumerated: the first len(path) draws take the
+    # branches in path, later ones branch 0
+    def __init__(self):
+        self.start([])
+
+    def start(self, path):
+        self.path = path
+        self.probs = [] # per draw, the probability of every branch
+
+    def draw(self, probs):
+        d = len(self.probs)
+        self.probs.append(probs)
+        return self.path[d] if d < len(self.path) else 0
+
+    def randint(self, high):
+        return self.draw([1.0/high]*high)
+
+    def chance(self, board, p):
+        # as DefaultPlayer.chance: branch 0 is the event, with probability p
+        if p >= 1 or p <= 0:
+            return p >= 1
+        return self.draw([p, 1-p]) == 0
+
+class Solver:
+    def __init__(self, config=None, policies=("max", "min"), me=0, max_entries=1000000, max_objects=None, symmetry=True):
+        """
+        config: overrides for game.GAME_CONFIG
+        policies: per seat, "max", "min", a name in game.PLAYER_TYPES or a player class
+        me: the seat whose win probability is computed
+        max_objects: cap on objects per purchase for "max"/"min" seats, which
+            also get the heuristics' purchases; None allows any set of objects,
+            which is exact but grows fast with money
+        max_entries: transposition table size; evicted states are recomputed
+        """
+        cfg = get_config(config)
+        self.nrows, self.ncols = cfg["shape"]
+        self.adj = get_adjacency(self.nrows, self.ncols)
+        self.cost = {"hut": int(round(cfg["cost_of_hut"]*MONEY_SCALE)), "station": int(round(cfg["cost_of_station"]*MONEY_SCALE))}
+        self.cfg = cfg
+        self.max_nturns = cfg["max_nturns"]
+        self.vps_to_win = cfg["vps_to_win"]
+        self.me = me
+        self.max_objects = max_objects
+        self.policies = [PLAYER_TYPES.get(p, p) for p in policies]
+        self.nplayers = len(policies)
+        self.heuristic = [p not in ("max", "min") for p in self.policies]
+        self.players = [p(k+1) if h else None for k, (p, h) in enumerate(zip(self.policies, self.heuristic))]
+        self.tile_slots = [self.adj.tile_slots[self.adj.tile_offsets[t]:self.adj.tile_offsets[t+1]].tolist() for t in xrange(self.nrows*self.ncols)]
+        syms = board_symmetries(self.nrows, self.ncols) if symmetry and not any(self.heuristic) else []
+        self.syms = [(operator.itemgetter(*tperm), operator.itemgetter(*sperm)) for tperm, sperm in syms]
+        self.table = TranspositionTable(max_entries)
+        self.rng = ForcedRng()
+        for p in self.players:
+            if p is not None:
+                p.chance = self.rng.chance
+        self.board = Board((self.nrows, self.ncols), {"hut": cfg["cost_of_hut"], "station": cfg["cost_of_station"]}, ntrees=0)
+        self.board.rng = self.rng
+
+    def start_state(self, tiles):
+        n = self.nplayers
+        return (tuple(np.ravel(tiles).tolist()), (0,)*self.adj.nslots, (0,)*n, (0,)*n, (0,)*n, (self.cfg["ngardens"], self.cfg["ncurses"], 0, 0), 0)
+
+    def deals(self):
+        """
+        [(probability, tiles), ...] of the initial board, as Board deals ntrees
+        trees onto uniformly random tiles
+        """
+        area = self.nrows*self.ncols
+        ntrees = self.cfg["ntrees"]
+        out = []
+        for combo in itertools.combinations_with_replacement(xrange(area), ntrees):
+            counts = collections.Counter(combo)
+            ways = np.math.factorial(ntrees)
+            for c in counts.values():
+                ways /= np.math.factorial(c)
+            tiles = [0]*area
+            for t, c in counts.iteritems():
+                tiles[t] = c
+            out.append((ways/float(area**ntrees), tiles))
+        return out
+
+    def solve(self):
+        """
+        seat me's exact win probability over the random deal
+        """
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, 20*self.max_nturns + 1000))
+        try:
+            return sum([p*self.value(self.start_state(tiles)) for p, tiles in self.deals()])
+        finally:
+            sys.setrecursionlimit(limit)
+
+    def key(self, s):
+        if not self.syms:
+            return s
+        tiles, grid = s[0], s[1]
+        return min([(tperm(tiles), sperm(grid)) for tperm, sperm in self.syms]) + s[2:]
+
+    def value(self, s):
+        key = self.key(s)
+        v = self.table.get(key)
+        if v is None:
+            v = self.compute(s)
+            self.table.put(key, v)
+        return v
+
+    def compute(self, s):
+        tiles, grid, money, vps, last, deck, turn = s
+        if turn == self.max_nturns:
+            return 0.0 # MAX_ITERS
+        if sum(tiles) == 0:
+            return self.reward(vps)
+        k = turn % self.nplayers
+        if self.heuristic[k]:
+            return sum([p*self.action_value(s, k, act) for p, act in self.heuristic_actions(s, k)])
+        pick = max if self.policies[k] == "max" else min
+        vals = [self.buy_value(s, k, acts) for acts in self.buys(s, k)]
+        vals.append(self.draw_value(s, k, None, pick))
+        return pick(vals)
+
+    def reward(self, vps):
+        vmax = max(vps)
+        if sum(vps) >= self.vps_to_win and vps[self.me] == vmax and vps.count(vmax) == 1:
+            return 1.0
+        return 0.0
+
+    def action_value(self, s, k, (act_name, acts)):
+        if act_name == "buy":
+            return self.buy_value(s, k, acts)
+        return self.draw_value(s, k, acts, None)
+
+    def buys(self, s, k):
+        """
+        every set of at most max_objects objects on distinct empty slots
+        that seat k can pay for, plus what each buying heuristic would buy
+        here after either purchase, so "max" never does worse than a heuristic;
+        as [(name, slot), ...] in slot order
+        """
+        tiles, grid, money, vps, last, deck, turn = s
+        money = money[k]
+        empty = [i for i, v in enumerate(grid) if v == 0]
+        out = []
+        def extend(j, acts, money):
+            if acts:
+                out.append(tuple(acts))
+            if self.max_objects is not None and len(acts) >= self.max_objects:
+                return
+            for i in xrange(j, len(empty)):
+                for nm in ["hut", "station"]:
+                    if money >= self.cost[nm]:
+                        acts.append((nm, empty[i]))
+                        extend(i+1, acts, money - self.cost[nm])
+                        acts.pop()
+        extend(0, [], money)
+        if self.max_objects is not None and money >= min(self.cost.values()):
+            self.set_board(s)
+            self.rng.start([]) # first tie-break
+            seen = set(out)
+            for cls in BUY_POLICIES:
+                p = cls(k+1)
+                for prev in [[], [("hut", None)], [("station", None)]]:
+                    p.purchases = list(prev)
+                    acts = tuple(sorted([(nm, i*(self.ncols-1) + j) for nm, (i,j) in p.buy_objects(self.board, money/float(MONEY_SCALE))], key=lambda a: a[1]))
+                    if acts and acts not in seen:
+                        seen.add(acts)
+                        out.append(acts)
+        return out
+
+    def buy_value(self, s, k, acts):
+        tiles, grid, money, vps, last, deck, turn = s
+        grid = list(grid)
+        for nm, slot in acts:
+            grid[slot] = HUT_VAL if nm == "hut" else k+1
+        money = list(money)
+        money[k] -= sum([self.cost[nm] for nm, slot in acts])
+        if self.heuristic[k]:
+            last = last[:k] + (OBJ_CODES[acts[-1][0]],) + last[k+1:]
+        return self.value((tiles, tuple(grid), tuple(money), vps, last, deck, turn+1))
+
+    def draw_value(self, s, k, curse, pick):
+        """
+        curse: the (tile, amount) to curse if the card is a curse, or None
+            for the best one by pick
+        """
+        tiles, grid, money, vps, last, (dg, dc, sg, sc), turn = s
+        if dg + dc == 0: # reshuffle the discard pile
+            dg, dc, sg, sc = sg, sc, 0, 0
+        v = 0.0
+        if dg > 0:
+            deck = (dg-1, dc, sg+1, sc)
+            area = len(tiles)
+            for t in xrange(area):
+                nhuts = len([1 for i in self.tile_slots[t] if grid[i] == HUT_VAL])
+                tiles2 = list(tiles)
+                tiles2[t] += HUT_MULTIPLIER*nhuts + 1
+                v += dg/float(dg + dc)/area*self.value((tuple(tiles2), grid, money, vps, last, deck, turn+1))
+        if dc > 0:
+            deck = (dg, dc-1, sg, sc+1)
+            if curse is None:
+                opts = [(t, n) for t in xrange(len(tiles)) for n in xrange(1, tiles[t]+1)]
+                cv = pick([self.curse_value(s, k, deck, t, n) for t, n in opts])
+            else:
+                cv = self.curse_value(s, k, deck, curse[0], curse[1])
+            v += dc/float(dg + dc)*cv
+        return v
+
+    def curse_value(self, s, k, deck, t, n):
+        tiles, grid, money, vps, last, _, turn = s
+        tiles = list(tiles)
+        tiles[t] -= n
+        vps = list(vps)
+        for i in self.tile_slots[t]:
+            if grid[i] > 0:
+                vps[grid[i]-1] += 1
+        money = list(money)
+        money[k] += (int(n > 1) + n)*MONEY_SCALE
+        if tiles[t] == 0:
+            deck = deck[:3] + (deck[3]+1,)
+        return self.value((tuple(tiles), grid, tuple(money), tuple(vps), last, deck, turn+1))
+
+    def set_board(self, s):
+        b = self.board
+        b.tiles[:] = np.reshape(s[0], b.tiles.shape)
+        b.grid[:] = np.reshape(s[1], b.grid.shape)
+        b.init_tree_index()
+        b.init_slot_values()
+        return b
+
+    def heuristic_actions(self, s, k):
+        """
+        [(probability, (act_name, acts)), ...] of seat k's heuristic, with
+        curse targets as (flat tile, amount) and purchases as (name, slot)
+        """
+        tiles, grid, money, vps, last, deck, turn = s
+        b = self.set_board(s)
+        p = self.players[k]
+        names = dict((v, nm) for nm, v in OBJ_CODES.iteritems())
+        out = []
+        path = []
+        while path is not None:
+            if out:
+                b.init_slot_values()
+            self.rng.start(path)
+            p.purchases = [(names[last[k]], None)] if last[k] else []
+            act_name, acts = p.take_action(b, money[k]/float(MONEY_SCALE))
+            if act_name == "buy":
+                acts = [(nm, i*(self.ncols-1) + j) for nm, (i,j) in acts]
+            else:
+                acts = (acts[0]*self.ncols + acts[1], acts[2])
+            branches = [path[d] if d < len(path) else 0 for d in xrange(len(self.rng.probs))]
+            out.append((np.prod([ps[i] for ps, i in zip(self.rng.probs, branches)]), (act_name, acts)))
+            # the next path in depth-first order: bump the deepest draw with branches left
+            path = None
+            for d in reversed(xrange(len(branches))):
+                if branches[d] + 1 < len(self.rng.probs[d]):
+                    path = branches[:d] + [branches[d] + 1]
+                    break
+        return out
+
+def score_players(config, opponent, ptypes=None, max_entries=1000000, max_objects=None):
+    """
+    exact win probability of every heuristic in seat 0 against a heuristic
+    opponent, next to the best achievable against it
+    returns {player type: win probability}, with "optimal" for the best policy
+    """
+    ptypes = ptypes if ptypes is not None else sorted(PLAYER_TYPES)
+    scores = {"optimal": Solver(config, ("max", opponent), max_entries=max_entries, max_objects=max_objects).solve()}
+    for p in ptypes:
+        scores[p] = Solver(config, (p, opponent), max_entries=max_entries).solve()
+    return scores
+
+if __name__ == '__main__':
+    import time
+    # the number of states grows exponentially with max_nturns, and fastest for "max"/"min" seats
+    config = {"shape": (3,3), "ntrees": 3, "ngardens": 1, "ncurses": 2, "vps_to_win": 2, "max_nturns": 7, "cost_of_station": 1}
+    t = time.time()
+    s = Solver(dict(config, max_nturns=5), ("max", "min"), max_objects=1)
+    v = s.solve()
+    print "max vs min, 5 turns: {0:.4f} ({1:.1f}s, {2} states, {3} symmetries)".format(v, time.time() - t, len(s.table), len(s.syms))
+    t = time.time()
+    scores = score_players(config, "selfish", max_objects=1)
+    print "vs selfish, {0} turns ({1:.1f}s):".format(config["max_nturns"], time.time() - t)
+    for p in sorted(scores, key=lambda p: -scores[p]):
+        print "    {0}: {1:.4f}".format(p, scores[p])
@@ -0,0 +1,207 @@
+import numpy as np
+
+def wilson_interval(k, n, z=1.96):
+    """
+    95% Wilson score interval for a share k/n; arrays in, (lo, hi) out
+    """
+    k = np.asarray(k, dtype=float)
+    n = np.maximum(np.asarray(n, dtype=float), 1)
+    p = k/n
+    center = (p + z*z/(2*n))/(1 + z*z/n)
+    half = z*np.sqrt(p*(1-p)/n + z*z/(4*n*n))/(1 + z*z/n)
+    return center - half, center + half
+
+class RunningStats:
+    def __init__(self, dim=None):
+        """
+        Welford mean/variance over scalars, or over vectors of length dim
+        """
+        shape = () if dim is None else (dim,)
+        self.n = 0
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def update(self, x):
+        self.n += 1
+        d = np.asarray(x, dtype=float) - self.mean
+        self.mean = self.mean + d/self.n
+        self.m2 = self.m2 + d*(np.asarray(x, dtype=float) - self.mean)
+
+    def merge(self, other):
+        # Chan et al.'s pairwise update
+        n = self.n + other.n
+        if n == 0:
+            return self
+        d = other.mean - self.mean
+        self.m2 = self.m2 + other.m2 + d*d*self.n*other.n/float(n)
+        self.mean = self.mean + d*other.n/float(n)
+        self.n = n
+        return self
+
+    def variance(self):
+        return self.m2/max(self.n - 1, 1)
+
+    def std(self):
+        return np.sqrt(self.variance())
+
+class RunningCovariance:
+    def __init__(self, dim=None):
+        """
+        streaming covariance between a scalar x and y (a scalar, or a vector of length dim)
+        """
+        shape = () if dim is None else (dim,)
+        self.n = 0
+        self.mean_x = 0.0
+        self.mean_y = np.zeros(shape)
+        self.m2_x = 0.0
+        self.m2_y = np.zeros(shape)
+        self.c_xy = np.zeros(shape)
+
+    def update(self, x, y):
+        y = np.asarray(y, dtype=float)
+        self.n += 1
+        dx = x - self.mean_x
+        self.mean_x += dx/self.n
+        dy = y - self.mean_y
+        self.mean_y = self.mean_y + dy/self.n
+        self.m2_x += dx*(x - self.mean_x)
+        self.m2_y = self.m2_y + dy*(y - self.mean_y)
+        self.c_xy = self.c_xy + dx*(y - self.mean_y)
+
+    def merge(self, other):
+        n = self.n + other.n
+        if n == 0:
+            return self
+        f = self.n*other.n/float(n)
+        dx = other.mean_x - self.mean_x
+        dy = other.mean_y - self.mean_y
+        self.m2_x += other.m2_x + dx*dx*f
+        self.m2_y = self.m2_y + other.m2_y + dy*dy*f
+        self.c_xy = self.c_xy + other.c_xy + dx*dy*f
+        self.mean_x += dx*other.n/float(n)
+        self.mean_y = self.mean_y + dy*other.n/float(n)
+        self.n = n
+        return self
+
+    def covariance(self):
+        return self.c_xy/max(self.n - 1, 1)
+
+    def correlation(self):
+        # nan where either side never varied, as np.corrcoef
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.c_xy/np.sqrt(self.m2_x*self.m2_y)
+
+class QuantileSketch:
+    def __init__(self, k=200, seed=0):
+        """
+        mergeable quantile sketch (KLL-style compactors): level h holds items
+        of weight 2**h; a full level is sorted and every other item (random
+        offset) moves up a level. Memory is O(k log(n/k)); min and max are exact.
+        """
+        self.k = k
+        self.levels = [[]]
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.rng = np.random.RandomState(seed)
+
+    def update(self, x):
+        self.levels[0].append(x)
+        self.n += 1
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+        if len(self.levels[0]) >= self.k:
+            self.compress()
+
+    def compress(self):
+        for h in xrange(len(self.levels)):
+            if len(self.levels[h]) < self.k:
+                continue
+            if h+1 == len(self.levels):
+                self.levels.append([])
+            items = sorted(self.levels[h])
+            # an odd item out stays at this level
+            self.levels[h] = [items.pop()] if len(items) % 2 else []
+            self.levels[h+1].extend(items[self.rng.randint(2)::2])
+
+    def merge(self, other):
+        for h, items in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append([])
+            self.levels[h].extend(items)
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.compress()
+        return self
+
+    def quantiles(self, qs):
+        """
+        qs: fractions in [0, 1], e.g. [0, .1, .5, .9, 1]
+        """
+        items = [(x, 2**h) for h, level in enumerate(self.levels) for x in level]
+        if not items:
+            return np.nan*np.ones(len(qs))
+        items.sort()
+        xs = np.array([x for x,w in items])
+        cum = np.cumsum([w for x,w in items]).astype(float)
+        out = xs[np.minimum(np.searchsorted(cum, np.asarray(qs)*cum[-1]), len(xs)-1)]
+        out = np.where(np.asarray(qs) <= 0, self.min, out)
+        return np.where(np.asarray(qs) >= 1, self.max, out)
+
+class GameStats:
+    def __init__(self, nplayers, max_nturns=None, k=200):
+        """
+        constant-memory per-game summaries: turns, VPs and money per player,
+        and the correlation of turns with total and per-player VPs
+        """
+        self.nplayers = nplayers
+        self.max_nturns = max_nturns
+        self.turns = QuantileSketch(k)
+        self.vps_total = QuantileSketch(k)
+        self.vps = [QuantileSketch(k) for i in xrange(nplayers)]
+        self.money = [QuantileSketch(k) for i in xrange(nplayers)]
+        self.vps_mean = RunningStats(nplayers)
+        self.money_mean = RunningStats(nplayers)
+        self.turns_vps = RunningCovariance(nplayers + 1)
+        self.nmax_iters = 0
+
+    def update(self, nturns, vps, money, max_iters=None):
+        """
+        max_iters: whether the game ended as MAX_ITERS; defaults to
+            nturns == max_nturns, which misses games stopped early as stuck
+        """
+        self.turns.update(nturns)
+        self.vps_total.update(sum(vps))
+        for k in xrange(self.nplayers):
+            self.vps[k].update(vps[k])
+            self.money[k].update(money[k])
+        self.vps_mean.update(vps)
+        self.money_mean.update(money)
+        self.turns_vps.update(nturns, [sum(vps)] + list(vps))
+        if max_iters if max_iters is not None else nturns == self.max_nturns:
+            self.nmax_iters += 1
+
+    def merge(self, other):
+        self.turns.merge(other.turns)
+        self.vps_total.merge(other.vps_total)
+        for k in xrange(self.nplayers):
+            self.vps[k].merge(other.vps[k])
+            self.money[k].merge(other.money[k])
+        self.vps_mean.merge(other.vps_mean)
+        self.money_mean.merge(other.money_mean)
+        self.turns_vps.merge(other.turns_vps)
+        self.nmax_iters += other.nmax_iters
+        return self
+
+    def print_summary(self, qs=(0, .1, .5, .9, 1), money_name="Money"):
+        print "Play counts: {0}".format(self.turns.quantiles(qs))
+        for k in xrange(self.nplayers):
+            print "{0} P{1}: {2}".format(money_name, k, self.money[k].quantiles(qs))
+        print "VPs total: {0}".format(self.vps_total.quantiles(qs))
+        for k in xrange(self.nplayers):
+            print "VPs P{0}: {1}".format(k, self.vps[k].quantiles(qs))
+        print "mean VPs: {0}".format(self.vps_mean.mean)
+        corrs = self.turns_vps.correlation()
+        print "corrs total={0}, {1}".format(corrs[0], ', '.join(["P{0}={1}".format(k, c) for k,c in enumerate(corrs[1:])]))
+        print "{0} games did not complete".format(self.nmax_iters)
@@ -0,0 +1,170 @@
+"""
+Append-only columnar store of per-game results.
+
+Every chunk is a directory of one .npy file per column (see row_dtype),
+holding consecutive games of one run: a config, a seating and a seed.
+index.jsonl gets one line per chunk once its columns are on disk, so a
+crash never leaves a half-written chunk visible. Columns are opened with
+np.load(mmap_mode="r"), and chunks are picked by config and seating from
+the index alone, so a query only reads the columns of matching chunks.
+"""
+import json
+import multiprocessing
+import os
+import shutil
+import numpy as np
+from game import get_config
+from runner import play_results, shards
+from batch import STATUS_NAMES
+
+def row_dtype(nplayers):
+    # money in 1/MONEY_SCALE units, as in Players.stats
+    return np.dtype([
+        ("game", "<i8"),
+        ("status", "i1"),
+        ("winner", "i1"), # seat, or -1 for no winner
+        ("nturns", "<i2"),
+        ("vps", "<i4", (nplayers,)),
+        ("money", "<i4", (nplayers,)),
+        ("huts", "<i2", (nplayers,)),
+        ("stations", "<i2", (nplayers,)),
+    ])
+
+COLUMNS = row_dtype(1).names
+
+def to_rows(rows, start, nplayers):
+    """
+    rows: [(status code, winner seat, nturns, vps, money, huts, stations), ...]
+        as filled in by runner.play_results; game numbers count from start
+    """
+    out = np.zeros(len(rows), dtype=row_dtype(nplayers))
+    out["game"] = np.arange(start, start + len(rows))
+    for k, name in enumerate(COLUMNS[1:]):
+        out[name] = [r[k] for r in rows]
+    return out
+
+def config_desc(config):
+    cfg = get_config(config)
+    cfg["shape"] = list(cfg["shape"])
+    return cfg
+
+class ResultStore:
+    def __init__(self, root):
+        self.root = root
+        if not os.path.exists(root):
+            os.makedirs(root)
+        self.index_fn = os.path.join(root, "index.jsonl")
+        # chunks an interrupted append left half-written
+        for fn in os.listdir(root):
+            if fn.startswith("chunk-") and fn.endswith(".tmp"):
+                shutil.rmtree(os.path.join(root, fn))
+
+    def index(self):
+        entries = []
+        if not os.path.exists(self.index_fn):
+            return entries
+        with open(self.index_fn) as f:
+            for line in f:
+                if line.endswith("\n"):
+                    entries.append(json.loads(line))
+        return entries
+
+    def append(self, rows, player_types, seed, config=None):
+        """
+        writes rows (a row_dtype array) as a new chunk
+        """
+        # past every chunk on disk, indexed or not: one renamed before a
+        # crash kept it out of the index is skipped, never overwritten
+        used = [int(fn[6:14]) for fn in os.listdir(self.root) if fn.startswith("chunk-")]
+        name = "chunk-{0:08d}".format(max(used) + 1 if used else 0)
+        tmp = os.path.join(self.root, name + ".tmp")
+        os.makedirs(tmp)
+        for col in COLUMNS:
+            np.save(os.path.join(tmp, col + ".npy"), np.ascontiguousarray(rows[col]))
+        os.rename(tmp, os.path.join(self.root, name))
+        entry = {"chunk": name, "config": config_desc(config), "players": list(player_types), "seed": seed, "ngames": len(rows)}
+        if len(rows):
+            entry["start"] = int(rows["game"][0])
+        with open(self.index_fn, "a") as f:
+            f.write(json.dumps(entry, sort_keys=True) + "\n")
+        return entry
+
+    def chunks(self, config=None, players=None, seed=None):
+        """
+        index entries matching every given filter
+        config: {name: value}; matches chunks whose full config agrees on those keys
+        players: a seating, e.g. ["selfish", "generous"]
+        """
+        want = config_desc(config) if config else {}
+        out = []
+        for e in self.index():
+            if any([e["config"].get(k) != want[k] for k in (config or {})]):
+                continue
+            if players is not None and e["players"] != list(players):
+                continue
+            if seed is not None and e["seed"] != seed:
+                continue
+            out.append(e)
+        return out
+
+    def columns(self, entry, columns=COLUMNS):
+        """
+        {column: read-only memmap} of one chunk
+        """
+        d = os.path.join(self.root, entry["chunk"])
+        return dict((c, np.load(os.path.join(d, c + ".npy"), mmap_mode="r")) for c in columns)
+
+    def load(self, columns=COLUMNS, **filters):
+        """
+        the given columns of every matching chunk, concatenated; all chunks
+        must have the same number of players if a per-player column is asked for
+        """
+        parts = [self.columns(e, columns) for e in self.chunks(**filters)]
+        if not parts:
+            return dict((c, np.zeros(0, dtype=row_dtype(1)[c].base)) for c in columns)
+        return dict((c, np.concatenate([p[c] for p in parts])) for c in columns)
+
+def play_chunk(args):
+    player_types, seed, start, stop, use_batch, config = args
+    rows = []
+    play_results(player_types, seed, start, stop, use_batch, config, rows=rows)
+    return args, to_rows(rows, start, len(player_types))
+
+def record_run(store, player_types, ngames, seed=0, config=None, use_batch=True, chunk_size=10000, nworkers=1):
+    """
+    plays games [0, ngames) of a run (seeded as in runner) and appends them
+    to store in chunks of about chunk_size games; workers play, this
+    process is the only writer
+    """
+    args = [(player_types, seed, a, b, use_batch, config) for a, b in shards(ngames, max(1, ngames/chunk_size))]
+    pool = multiprocessing.Pool(nworkers) if nworkers > 1 else None
+    try:
+        for (player_types, seed, a, b, use_batch, config), rows in (pool.imap_unordered if pool else map)(play_chunk, args):
+            store.append(rows, player_types, seed, config)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+def summarize(store, **filters):
+    print_summary(store.load(["status", "winner", "nturns", "vps"], **filters))
+
+def print_summary(cols):
+    """
+    cols: {column: array} with at least status, winner, nturns and vps
+    """
+    n = len(cols["status"])
+    print "{0} games".format(n)
+    if n == 0:
+        return
+    for k, name in enumerate(STATUS_NAMES):
+        print "{0}: {1:.3f}".format(name, (cols["status"] == k).mean())
+    print "winner seat shares: {0}".format(np.bincount(cols["winner"][cols["winner"] >= 0], minlength=cols["vps"].shape[1])/float(n))
+    print "mean turns: {0:.1f}, mean VPs: {1}".format(cols["nturns"].mean(), cols["vps"].mean(axis=0))
+
+if __name__ == '__main__':
+    store = ResultStore("results")
+    for ptypes in [["selfish", "generous"], ["reasonable", "reasonable"]]:
+        for ntrees in [5, 9]:
+            record_run(store, ptypes, 2000, config={"ntrees": ntrees}, chunk_size=1000)
+    summarize(store, players=["selfish", "generous"], config={"ntrees": 9})
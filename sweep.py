@@ -0,0 +1,141 @@
+"""
+Parameter sweeps over game.GAME_CONFIG with an on-disk result cache.
+
+Each cell (a config override, the seating, seed and ngames) is stored in
+cache_dir under the sha1 of its canonical JSON, so reruns and widened
+ranges only play the cells that are missing. Cells are split into
+units of unit_size games that share one process pool.
+"""
+import collections
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+from game import get_config
+from runner import shards
+from tournament import play_unit
+
+def cell_key(config, player_types, seed, ngames):
+    # the full config, so changing a default in GAME_CONFIG invalidates old cells
+    desc = {"config": get_config(config), "players": list(player_types), "seed": seed, "ngames": ngames}
+    desc["config"]["shape"] = list(desc["config"]["shape"])
+    return hashlib.sha1(json.dumps(desc, sort_keys=True)).hexdigest(), desc
+
+def load_cell(cache_dir, key):
+    fn = os.path.join(cache_dir, key + ".json")
+    if not os.path.exists(fn):
+        return None
+    with open(fn) as f:
+        return collections.Counter(json.load(f)["outcomes"])
+
+def save_cell(cache_dir, key, desc, outcomes):
+    # write-then-rename, so an interrupted sweep never leaves a partial cell
+    fn = os.path.join(cache_dir, key + ".json")
+    with open(fn + ".tmp", "w") as f:
+        json.dump(dict(desc, outcomes=dict(outcomes)), f, sort_keys=True)
+    os.rename(fn + ".tmp", fn)
+
+def p1_win_rate(outcomes):
+    return outcomes["P1"]/float(max(1, sum(outcomes.values())))
+
+def play_cells(cells, axes, player_types, ngames, seed, cache_dir, nworkers, unit_size, use_batch):
+    """
+    cells: [(axis values, ...), ...]; returns {cell: Counter of outcomes}
+    """
+    results = {}
+    todo = {} # {key: (desc, config, [cells])}; equal cells share a key and are played once
+    for cell in cells:
+        config = dict(zip(axes, cell))
+        key, desc = cell_key(config, player_types, seed, ngames)
+        if key in todo:
+            todo[key][2].append(cell)
+            continue
+        outcomes = load_cell(cache_dir, key)
+        if outcomes is not None:
+            results[cell] = outcomes
+        else:
+            todo[key] = (desc, config, [cell])
+    if not todo:
+        return results
+
+    nunits = max(1, ngames/unit_size)
+    units = []
+    for a, b in shards(ngames, nunits):
+        units.extend([(key, (tuple(player_types), seed, a, b, use_batch, config)) for key, (desc, config, cs) in todo.iteritems()])
+    partial = collections.defaultdict(collections.Counter)
+    ndone = collections.Counter()
+    pool = multiprocessing.Pool(nworkers)
+    try:
+        for key, outcomes in pool.imap_unordered(play_sweep_unit, units):
+            partial[key].update(outcomes)
+            ndone[key] += 1
+            if ndone[key] == nunits:
+                desc, config, cs = todo[key]
+                save_cell(cache_dir, key, desc, partial[key])
+                outcomes = partial.pop(key)
+                for cell in cs:
+                    results[cell] = outcomes
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+def play_sweep_unit(args):
+    key, unit = args
+    seating, outcomes = play_unit(unit)
+    return key, outcomes
+
+def refine_cells(results, axes, metric, threshold):
+    """
+    for every pair of neighboring cells along a numeric axis whose metric
+    differs by more than threshold, returns the cell halfway between them
+    """
+    new = set()
+    for k, axis in enumerate(axes):
+        lines = collections.defaultdict(list)
+        for cell in results:
+            if isinstance(cell[k], (int, long, float)):
+                lines[cell[:k] + cell[k+1:]].append(cell)
+        for line in lines.values():
+            line.sort(key=lambda c: c[k])
+            for c1, c2 in zip(line[:-1], line[1:]):
+                if abs(metric(results[c1]) - metric(results[c2])) <= threshold:
+                    continue
+                v1, v2 = c1[k], c2[k]
+                if isinstance(v1, float) or isinstance(v2, float):
+                    mid = (v1 + v2)/2.0
+                else:
+                    mid = (v1 + v2)/2
+                if v1 < mid < v2:
+                    new.add(c1[:k] + (mid,) + c1[k+1:])
+    return [c for c in new if c not in results]
+
+def sweep(ranges, player_types, ngames=1000, seed=0, cache_dir="sweep_cache", nworkers=None, unit_size=250, use_batch=True, refine=0, threshold=0.1, metric=p1_win_rate):
+    """
+    ranges: {config name: [values, ...]} over the keys of game.GAME_CONFIG;
+        every combination is played
+    refine: rounds of adaptive refinement; each round plays the midpoint
+        between neighboring cells whose metric differs by more than threshold
+    returns (axes, {cell: Counter of outcomes}), cell = values in axes order
+    """
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    axes = sorted(ranges)
+    cells = list(itertools.product(*[ranges[a] for a in axes]))
+    results = play_cells(cells, axes, player_types, ngames, seed, cache_dir, nworkers, unit_size, use_batch)
+    for i in xrange(refine):
+        cells = refine_cells(results, axes, metric, threshold)
+        if not cells:
+            break
+        results.update(play_cells(cells, axes, player_types, ngames, seed, cache_dir, nworkers, unit_size, use_batch))
+    return axes, results
+
+def print_sweep(axes, results, metric=p1_win_rate):
+    print ', '.join(axes) + ': metric'
+    for cell in sorted(results):
+        print "{0}: {1:.3f} (n={2})".format(', '.join([str(v) for v in cell]), metric(results[cell]), sum(results[cell].values()))
+
+if __name__ == '__main__':
+    axes, results = sweep({"ntrees": [5, 9, 13], "cost_of_station": [2, 3, 4]}, ["selfish", "generous"], ngames=500, refine=2)
+    print_sweep(axes, results)
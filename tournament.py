@@ -0,0 +1,121 @@
+"""
+Round-robin tournament over the player types in game.PLAYER_TYPES.
+
+Every seating (an ordered tuple of player types) is split into work units
+of unit_size games, and all units go through one process pool, so cores
+stay busy until the last unit finishes. Every seating plays the same
+game seeds, so matchups are compared on the same boards and decks.
+"""
+import collections
+import itertools
+import multiprocessing
+import numpy as np
+from game import PLAYER_TYPES, get_players
+from runner import play_outcomes, shards
+from stats import wilson_interval
+
+def outcome_names(nseats):
+    # a seat's win, then the statuses without a winner
+    return ["P{0}".format(k+1) for k in xrange(nseats)] + ["TIE", "LOSS", "MAX_ITERS"]
+
+def outcome_name(seating, status, winner):
+    if status == "WIN":
+        return "P{0}".format([p.name for p in get_players(seating)].index(winner) + 1)
+    return status
+
+def get_seatings(ptypes, nseats=(2,)):
+    # each seating once, even if ptypes or nseats repeat an entry
+    seatings = []
+    seen = set()
+    for n in nseats:
+        for s in itertools.product(ptypes, repeat=n):
+            if s not in seen:
+                seen.add(s)
+                seatings.append(s)
+    return seatings
+
+def play_unit(args):
+    # args: (seating, seed, start, stop, use_batch[, config]), as for runner.play_outcomes
+    seating = args[0]
+    outcomes = collections.Counter()
+    for (status, winner), c in play_outcomes(args).iteritems():
+        outcomes[outcome_name(seating, status, winner)] += c
+    return seating, outcomes
+
+def iter_tournament(ptypes=None, ngames=1000, nseats=(2,), seed=0, nworkers=None, unit_size=250, use_batch=False):
+    """
+    yields (units done, total units, {seating: Counter of outcomes}) as units finish
+    ptypes: player types to enter; defaults to all of PLAYER_TYPES
+    nseats: table sizes to play, e.g. (2, 3, 4)
+    """
+    ptypes = ptypes if ptypes is not None else sorted(PLAYER_TYPES)
+    seatings = get_seatings(ptypes, nseats)
+    # first unit of every seating, then the second, ... so partial results fill in evenly
+    units = []
+    for a, b in shards(ngames, max(1, ngames/unit_size)):
+        units.extend([(s, seed, a, b, use_batch) for s in seatings])
+
+    results = dict((s, collections.Counter()) for s in seatings)
+    pool = multiprocessing.Pool(nworkers)
+    try:
+        for k, (seating, outcomes) in enumerate(pool.imap_unordered(play_unit, units)):
+            results[seating].update(outcomes)
+            yield k+1, len(units), results
+    finally:
+        pool.close()
+        pool.join()
+
+def tournament_matrix(results, ptypes, nseats=2):
+    """
+    counts[i,j,...,o]: games of seating (ptypes[i], ptypes[j], ...) with outcome o,
+        outcomes ordered as outcome_names(nseats)
+    returns counts, shares, and the lower and upper Wilson bounds on the shares
+    """
+    names = outcome_names(nseats)
+    counts = np.zeros([len(ptypes)]*nseats + [len(names)], dtype=int)
+    for seating, outcomes in results.iteritems():
+        if len(seating) != nseats:
+            continue
+        ind = tuple(ptypes.index(p) for p in seating)
+        counts[ind] = [outcomes[o] for o in names]
+    n = counts.sum(axis=-1)[..., None]
+    lo, hi = wilson_interval(counts, n)
+    return counts, counts/np.maximum(n, 1).astype(float), lo, hi
+
+def print_matrix(results, ptypes):
+    """
+    share of games won by the row player (seat 1) against the column
+    player (seat 2), with a 95% interval
+    """
+    counts, shares, lo, hi = tournament_matrix(results, ptypes)
+    width = max([len(p) for p in ptypes]) + 2
+    print ' '*width + ''.join([p.rjust(26) for p in ptypes])
+    for i, p in enumerate(ptypes):
+        cells = ["{0:.2f} [{1:.2f},{2:.2f}] n={3}".format(shares[i,j,0], lo[i,j,0], hi[i,j,0], counts[i,j].sum()).rjust(26) for j in xrange(len(ptypes))]
+        print p.ljust(width) + ''.join(cells)
+
+def print_seatings(results):
+    for seating in sorted(results):
+        outcomes = results[seating]
+        n = sum(outcomes.values())
+        names = outcome_names(len(seating))
+        print "{0}: {1}".format(' vs '.join(seating), ', '.join(["{0} {1:.2f}".format(o, outcomes[o]/float(max(n, 1))) for o in names]))
+
+def run_tournament(ptypes=None, ngames=1000, nseats=(2,), seed=0, nworkers=None, unit_size=250, use_batch=False, print_every=None):
+    """
+    print_every: print the partial win matrix after every this many units
+    """
+    ptypes = ptypes if ptypes is not None else sorted(PLAYER_TYPES)
+    results = {}
+    for k, nunits, results in iter_tournament(ptypes, ngames, nseats, seed, nworkers, unit_size, use_batch):
+        if print_every and k % print_every == 0 and k < nunits:
+            print "--- {0}/{1} units ---".format(k, nunits)
+            print_matrix(results, ptypes)
+    print '=================='
+    if 2 in nseats:
+        print_matrix(results, ptypes)
+    print_seatings(results)
+    return results
+
+if __name__ == '__main__':
+    run_tournament(ngames=400, use_batch=True)